@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+#
+# Content-addressed store shared by all SSBs, whether Ice, Cloudz or
+# provision.py made them.
+#
+# Every SSB has its own browser profile under ~/.local/share/ice
+# (profiles, firefox and epiphany) with its own search.json.mozlz4,
+# user.js and icons, and its icon in ~/.local/share/ice/icons. The store
+# keeps one read-only copy of each distinct file, named by its SHA-256,
+# under ~/.local/share/ice/blobs, and puts it back into each app the
+# same way a profile is cloned from the template (profiletemplate): a
+# reflink where the filesystem has them, else a hardlink, else a copy.
+# Only files nobody writes to are shared (SHARED_NAMES and icons, see
+# shareable()); profile databases, prefs.js and the like stay private
+# to their app. The store always gets its own copy: an app's file is
+# never made read-only or given to another app.
+#
+# refs.db records which app file was linked to which blob, with the
+# file's mtime and size at the time. A file that has since been changed
+# or removed no longer counts as a reference, and gc() deletes the blobs
+# nothing refers to.
+#
+#   blobstore.py dedupe     link identical files in every SSB to the store
+#   blobstore.py gc         drop references that went stale, then blobs
+#   blobstore.py stats      dedup ratio and bytes saved
+
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+
+import profiletemplate
+import ssb
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS refs (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+)
+"""
+
+# seed and template files: written once by Ice, only read by the browser
+SHARED_NAMES = frozenset(["search.json.mozlz4", "userChrome.css", "user.js"])
+SHARED_SUFFIXES = (".png", ".ico", ".svg", ".xpm", ".jpg", ".gif")
+
+BLOB_DIR = "{0}/blobs".format(ssb.ICE_DIR)
+# where SSBs keep files; never the trash or the profile templates
+APP_DIRS = (ssb.PROFILES_DIR, ssb.FF_PROFILES_DIR, ssb.EPIPHANY_PROFILES_DIR,
+            ssb.ICON_DIR)
+
+
+def shareable(path):
+    name = os.path.basename(path)
+    return name in SHARED_NAMES or name.lower().endswith(SHARED_SUFFIXES)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BlobStore:
+
+    def __init__(self, root=BLOB_DIR, app_dirs=APP_DIRS):
+        self.root = root
+        self.app_dirs = app_dirs
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        with self.connect() as db:
+            db.execute(_SCHEMA)
+
+    def connect(self):
+        return sqlite3.connect("{0}/refs.db".format(self.root), timeout=10)
+
+    def blobpath(self, digest):
+        return "{0}/{1}/{2}".format(self.root, digest[:2], digest)
+
+    def put(self, path):
+        # Returns the digest of path's content, storing it if it is new
+        digest = file_digest(path)
+        blob = self.blobpath(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = "{0}.{1}.{2}.tmp".format(blob, os.getpid(),
+                                           threading.get_ident())
+            dev = os.stat(os.path.dirname(blob)).st_dev
+            # a reflink or a copy, never a second link to the app's inode
+            if not profiletemplate.reflink(path, tmp, dev):
+                shutil.copyfile(path, tmp)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, blob)
+        return digest
+
+    def link(self, digest, dest):
+        # Puts blob digest at dest (replacing whatever is there) and
+        # returns how: "reflink", "hardlink" or "copy"
+        blob = self.blobpath(digest)
+        if os.path.exists(dest) and os.path.samefile(blob, dest):
+            # linked by an earlier run (rename() between two links to one
+            # inode would do nothing)
+            kind = "hardlink"
+        else:
+            tmp = "{0}.ice-link.tmp".format(dest)
+            dev = os.stat(os.path.dirname(dest)).st_dev
+            kind = profiletemplate.clone_file(blob, tmp,
+                                              os.path.basename(dest), dev)
+            os.replace(tmp, dest)
+        self.remember(dest, digest, kind)
+        return kind
+
+    def remember(self, path, digest, kind):
+        st = os.stat(path)
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO refs (path, digest, kind, mtime,"
+                " size) VALUES (?, ?, ?, ?, ?)",
+                (path, digest, kind, st.st_mtime_ns, st.st_size)
+            )
+
+    def app_files(self):
+        # Regular files under the app directories
+        for top in self.app_dirs:
+            for dirpath, dirnames, filenames in os.walk(top):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if os.path.isfile(path) and not os.path.islink(path):
+                        yield path
+
+    def unshare(self, path):
+        # Gives path back its own writable inode
+        tmp = "{0}.ice-link.tmp".format(path)
+        shutil.copyfile(path, tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+        with self.connect() as db:
+            db.execute("DELETE FROM refs WHERE path = ?", (path,))
+
+    def dedupe(self):
+        # Returns the number of files linked to the store
+        with self.connect() as db:
+            known = {row[0]: row[1:] for row in db.execute(
+                "SELECT path, mtime, size FROM refs")}
+        linked = 0
+        for path in self.app_files():
+            if not shareable(path):
+                # linked by an older version that shared everything
+                if path in known:
+                    self.unshare(path)
+                continue
+            st = os.stat(path)
+            if known.get(path) == (st.st_mtime_ns, st.st_size):
+                continue
+            # empty files gain nothing; executables keep their own inode
+            # so the store's read-only mode does not reach them
+            if st.st_size == 0 or st.st_mode & 0o111:
+                continue
+            self.link(self.put(path), path)
+            linked += 1
+        return linked
+
+    def prune(self, db):
+        # Forget references whose file was changed or removed
+        stale = []
+        for path, mtime, size in db.execute(
+                "SELECT path, mtime, size FROM refs").fetchall():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stale.append(path)
+                continue
+            if (st.st_mtime_ns, st.st_size) != (mtime, size):
+                stale.append(path)
+        db.executemany("DELETE FROM refs WHERE path = ?",
+                       [(path,) for path in stale])
+        return len(stale)
+
+    def gc(self):
+        # Returns (stale references dropped, blobs deleted, bytes freed)
+        with self.lock, self.connect() as db:
+            stale = self.prune(db)
+            used = {row[0] for row in db.execute(
+                "SELECT DISTINCT digest FROM refs")}
+        deleted = 0
+        freed = 0
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for blob in os.scandir(prefix.path):
+                if blob.name in used or blob.name.endswith(".tmp"):
+                    continue
+                freed += blob.stat().st_size
+                os.remove(blob.path)
+                deleted += 1
+        return stale, deleted, freed
+
+    def stats(self):
+        # {"files", "blobs", "logical", "physical", "saved", "ratio"}:
+        # logical is what the apps would use with their own copies,
+        # physical is the store plus the files that had to be copied
+        with self.connect() as db:
+            self.prune(db)
+            refs = db.execute(
+                "SELECT digest, kind, size FROM refs").fetchall()
+        logical = sum(size for digest, kind, size in refs)
+        copied = sum(size for digest, kind, size in refs if kind == "copy")
+        blobs = {}
+        for digest, kind, size in refs:
+            blobs[digest] = size
+        physical = sum(blobs.values()) + copied
+        return {"files": len(refs), "blobs": len(blobs), "logical": logical,
+                "physical": physical, "saved": logical - physical,
+                "ratio": logical / physical if physical else 1.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Shared content-addressed store for SSB resources"
+    )
+    parser.add_argument("command", choices=["dedupe", "gc", "stats"])
+    args = parser.parse_args()
+
+    store = BlobStore()
+    if args.command == "dedupe":
+        print("{0} files linked to the store".format(store.dedupe()))
+    elif args.command == "gc":
+        stale, deleted, freed = store.gc()
+        print("{0} stale references, {1} blobs deleted, {2} freed".format(
+            stale, deleted, ssb.human_size(freed)))
+
+    stats = store.stats()
+    print("{0} files in {1} blobs: {2} stored as {3}, {4} saved, "
+          "dedup ratio {5:.2f}".format(
+              stats["files"], stats["blobs"], ssb.human_size(stats["logical"]),
+              ssb.human_size(stats["physical"]), ssb.human_size(stats["saved"]),
+              stats["ratio"]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
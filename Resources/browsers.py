@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+#
+# The browsers Ice and Cloudz can make SSBs for, and where they are.
+#
+# TABLE is the one list of supported browsers: the key stored with an
+# SSB, the labels for the GTK and Qt windows, the engine (which decides
+# how the Exec= line and profile are written) and the names the browser
+# is installed under as a command, a flatpak or a snap.
+#
+# discover() scans PATH and the flatpak and snap export directories once
+# and caches what it found in ~/.local/share/ice/browsers.json against
+# the mtimes of those directories, so a start where nothing was installed
+# or removed reads a single small file.
+#
+#   browsers.py          list the installed browsers
+
+import json
+import os
+import sys
+
+HOME = os.getenv("HOME")
+CACHE_FILE = "{0}/.local/share/ice/browsers.json".format(HOME)
+
+FLATPAK_DIRS = ["/var/lib/flatpak/exports/bin",
+                "{0}/.local/share/flatpak/exports/bin".format(HOME)]
+SNAP_DIRS = ["/snap/bin"]
+
+# Chromium family SSBs can share a profile or get an isolated one;
+# Firefox and GNOME Web SSBs always get their own.
+CHROMIUM = "chromium"
+FIREFOX = "firefox"
+EPIPHANY = "epiphany"
+
+
+class Browser:
+    __slots__ = ('key', 'label', 'qt_label', 'engine', 'commands',
+                 'flatpaks', 'snaps')
+
+    def __init__(self, key, label, qt_label, engine, commands, flatpaks,
+                 snaps):
+        self.key = key
+        self.label = label
+        self.qt_label = qt_label
+        self.engine = engine
+        # the first command is what Exec= uses when nothing is found
+        self.commands = commands
+        self.flatpaks = flatpaks
+        self.snaps = snaps
+
+    def always_isolated(self):
+        return self.engine != CHROMIUM
+
+
+# in the order they are shown
+TABLE = [
+    Browser("brave", "Brave", "&Brave", CHROMIUM,
+            ["brave", "brave-browser"], ["com.brave.Browser"], ["brave"]),
+    Browser("chrome", "Chrome", "&Chrome", CHROMIUM,
+            ["google-chrome", "google-chrome-stable"],
+            ["com.google.Chrome"], []),
+    Browser("chromium", "Chromium", "C&hromium", CHROMIUM,
+            ["chromium-browser", "chromium"], ["org.chromium.Chromium"],
+            ["chromium"]),
+    Browser("firefox", "Firefox", "&Firefox", FIREFOX,
+            ["firefox"], ["org.mozilla.firefox"], ["firefox"]),
+    Browser("vivaldi", "Vivaldi", "&Vivaldi", CHROMIUM,
+            ["vivaldi", "vivaldi-stable"], ["com.vivaldi.Vivaldi"], []),
+    Browser("epiphany", "GNOME Web", "GNOME &Web", EPIPHANY,
+            ["epiphany", "epiphany-browser"], ["org.gnome.Epiphany"],
+            ["epiphany"]),
+]
+
+BY_KEY = {browser.key: browser for browser in TABLE}
+
+_found = None
+
+
+def search_dirs():
+    dirs = []
+    for directory in os.getenv("PATH", "/usr/bin:/bin").split(os.pathsep):
+        if directory and directory not in dirs:
+            dirs.append(directory)
+    return dirs + FLATPAK_DIRS + SNAP_DIRS
+
+
+def stamps(dirs):
+    found = {}
+    for directory in dirs:
+        try:
+            found[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            found[directory] = None
+    return found
+
+
+def scan(dirs):
+    # {key: command for Exec=}, by the first directory that has it
+    names = {}
+    for directory in dirs:
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                names.setdefault(entry.name, entry.path)
+
+    found = {}
+    for browser in TABLE:
+        for name in browser.commands:
+            path = names.get(name)
+            if path is not None and os.access(path, os.X_OK):
+                # in PATH itself, so keep Exec= as portable as it was;
+                # flatpak and snap exports go in by full path
+                if os.path.dirname(path) in FLATPAK_DIRS + SNAP_DIRS:
+                    found[browser.key] = path
+                else:
+                    found[browser.key] = name
+                break
+        else:
+            for name in browser.flatpaks + browser.snaps:
+                path = names.get(name)
+                if path is not None and os.access(path, os.X_OK):
+                    found[browser.key] = path
+                    break
+    return found
+
+
+def discover(cache_file=CACHE_FILE):
+    global _found
+    if _found is not None:
+        return _found
+
+    dirs = search_dirs()
+    current = stamps(dirs)
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached["stamps"] == current:
+            _found = cached["browsers"]
+            return _found
+    except (OSError, ValueError, KeyError):
+        pass
+
+    _found = scan(dirs)
+    tmp = "{0}.{1}.tmp".format(cache_file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump({"stamps": current, "browsers": _found}, f)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+    return _found
+
+
+def installed(key):
+    return key in discover()
+
+
+def command(key):
+    # Exec= command for the browser key
+    return discover().get(key, BY_KEY[key].commands[0])
+
+
+def default():
+    # Key of the browser to preselect: Firefox if it is there (Ice's
+    # choice before the table), else the first one installed in TABLE
+    # order, else None. The radio groups follow TABLE, so Brave leads
+    # them; Ice and Cloudz set the preselected button active themselves.
+    found = discover()
+    if FIREFOX in found:
+        return FIREFOX
+    for browser in TABLE:
+        if browser.key in found:
+            return browser.key
+    return None
+
+
+if __name__ == '__main__':
+    for browser in TABLE:
+        print("{0:<10} {1}".format(
+            browser.key, discover().get(browser.key, "-")))
+    sys.exit(0)
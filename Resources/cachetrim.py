@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Keeps the browser caches of isolated SSB profiles under one byte budget.
+#
+# Every isolated Chromium based SSB (--user-data-dir under
+# ~/.local/share/ice/profiles) keeps its own HTTP cache, code cache, GPU
+# cache and service worker CacheStorage, none of them limited across
+# SSBs. This collects the cache entries of all of them and deletes the
+# least recently used (by the later of atime and mtime) until the total
+# is within the budget.
+#
+# Only entry files are removed: simple cache entries (<hash>_0, _1, _s)
+# and blockfile external files (f_xxxxxx). Index files, data_N block
+# files and everything outside the cache directories (cookies, local
+# storage, history) are never touched, and entries written in the last
+# min_age seconds are left alone, so browsers can keep running; a
+# missing entry is a cache miss to them. Firefox SSBs run with the disk
+# cache disabled and are not scanned.
+#
+#   cachetrim.py [--budget BYTES] [--dry-run]
+
+import argparse
+import os
+import re
+import sys
+import time
+
+import config
+import ssb
+
+# relative to each profile directory (Default, Profile 1, ...)
+_CACHE_DIRS = ["Cache", "Code Cache", "GPUCache",
+               "Service Worker/CacheStorage"]
+# relative to the user data directory
+_SHARED_CACHE_DIRS = ["GrShaderCache", "ShaderCache"]
+
+_ENTRY = re.compile(r"^(?:[0-9a-f]{16}_(?:0|1|s)|f_[0-9a-f]{6})$")
+
+
+class Entry:
+    __slots__ = ('path', 'size', 'used')
+
+    def __init__(self, path, size, used):
+        self.path = path
+        self.size = size
+        self.used = used
+
+
+def cache_dirs(profiles_dir=ssb.PROFILES_DIR):
+    try:
+        user_data_dirs = [e.path for e in os.scandir(profiles_dir)
+                          if e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return
+    for user_data in user_data_dirs:
+        for name in _SHARED_CACHE_DIRS:
+            yield "{0}/{1}".format(user_data, name)
+        try:
+            profiles = [e.path for e in os.scandir(user_data)
+                        if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
+        for profile in profiles:
+            for name in _CACHE_DIRS:
+                yield "{0}/{1}".format(profile, name)
+
+
+def entries(directory):
+    stack = [directory]
+    while stack:
+        try:
+            found = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in found:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # the-real-index and friends
+                    if entry.name != "index-dir":
+                        stack.append(entry.path)
+                elif _ENTRY.match(entry.name):
+                    st = entry.stat(follow_symlinks=False)
+                    yield Entry(entry.path, st.st_blocks * 512,
+                                max(st.st_atime, st.st_mtime))
+            except OSError:
+                continue
+
+
+def trim(budget, min_age=300, dry_run=False, profiles_dir=ssb.PROFILES_DIR):
+    # Returns (bytes in caches before, bytes reclaimed, files removed)
+    found = []
+    for directory in cache_dirs(profiles_dir):
+        found.extend(entries(directory))
+    total = sum(entry.size for entry in found)
+    if total <= budget:
+        return total, 0, 0
+
+    recent = time.time() - min_age
+    found.sort(key=lambda entry: entry.used)
+    reclaimed = 0
+    removed = 0
+    for entry in found:
+        if total - reclaimed <= budget or entry.used > recent:
+            break
+        if not dry_run:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+        reclaimed += entry.size
+        removed += 1
+    return total, reclaimed, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trim the caches of isolated Ice SSBs to a byte budget"
+    )
+    parser.add_argument("--budget", type=int,
+                        default=config.getint("cachetrim", "budget"),
+                        help="bytes all SSB caches may use together")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="report what would be removed")
+    args = parser.parse_args()
+
+    total, reclaimed, removed = trim(
+        args.budget, config.getfloat("cachetrim", "min_age"), args.dry_run
+    )
+    print("caches: {0}, budget {1}; {2} {3} entries, {4}".format(
+        ssb.human_size(total), ssb.human_size(args.budget),
+        "would remove" if args.dry_run else "removed", removed,
+        ssb.human_size(reclaimed)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# Persistent index of the Ice SSBs found in ~/.local/share/applications.
+#
+# The applications directory is shared with every other package on the
+# system, so parsing all of it on each start is slow. The catalog keeps
+# one row per file keyed by path, mtime and size (non-SSB files included,
+# so they are not opened again) and only re-parses files that changed.
+
+import os
+import sqlite3
+import sys
+from contextlib import closing
+
+import desktopentry
+
+# Bump when the table layout changes; older indexes are dropped and
+# rebuilt from a full scan.
+_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    is_ssb INTEGER NOT NULL,
+    name TEXT,
+    icon TEXT,
+    profile TEXT,
+    browser TEXT,
+    isolation TEXT,
+    exec_line TEXT
+)
+"""
+
+
+class Catalog:
+
+    def __init__(self, dbpath, apps_dir):
+        self.dbpath = dbpath
+        self.apps_dir = apps_dir
+        os.makedirs(os.path.dirname(dbpath), exist_ok=True)
+        with closing(self.connect()) as db, db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != _VERSION:
+                db.execute("DROP TABLE IF EXISTS entries")
+                db.execute("PRAGMA user_version = {0}".format(_VERSION))
+            db.execute(_SCHEMA)
+
+    def connect(self):
+        # One connection per call keeps the catalog usable from worker
+        # threads as well as from the GTK main loop. Callers close it with
+        # closing(); the connection's own with block only commits.
+        return sqlite3.connect(self.dbpath, timeout=10)
+
+    def entries(self):
+        with closing(self.connect()) as db, db:
+            rows = db.execute(
+                "SELECT path, name, icon, profile, browser, isolation,"
+                " exec_line FROM entries WHERE is_ssb = 1 ORDER BY path"
+            ).fetchall()
+        return [desktopentry.DesktopEntry(*row) for row in rows]
+
+    def scan(self):
+        found = {}
+        try:
+            it = os.scandir(self.apps_dir)
+        except FileNotFoundError:
+            # a fresh HOME; ensure_dirs() has not made it yet
+            return found
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found[entry.path] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def refresh(self):
+        found = self.scan()
+        with closing(self.connect()) as db, db:
+            known = {
+                path: (mtime, size) for path, mtime, size in
+                db.execute("SELECT path, mtime, size FROM entries")
+            }
+
+            gone = [(path,) for path in known if path not in found]
+            db.executemany("DELETE FROM entries WHERE path = ?", gone)
+
+            for path, stamp in found.items():
+                if known.get(path) != stamp:
+                    self.store(db, path, stamp)
+
+        return self.entries()
+
+    def update(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.forget(path)
+            return None
+        with closing(self.connect()) as db, db:
+            return self.store(db, path, (st.st_mtime_ns, st.st_size))
+
+    def forget(self, path):
+        with closing(self.connect()) as db, db:
+            db.execute("DELETE FROM entries WHERE path = ?", (path,))
+
+    def store(self, db, path, stamp):
+        try:
+            entry = desktopentry.parse(path)
+        except OSError:
+            entry = None
+
+        if entry is None:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (path, mtime, size, is_ssb)"
+                " VALUES (?, ?, ?, 0)", (path,) + stamp
+            )
+            return None
+
+        db.execute(
+            "INSERT OR REPLACE INTO entries (path, mtime, size, is_ssb,"
+            " name, icon, profile, browser, isolation, exec_line)"
+            " VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?)",
+            (path,) + stamp + entry.astuple()[1:]
+        )
+        return entry
+
+    def rebuild(self):
+        with closing(self.connect()) as db, db:
+            db.execute("DELETE FROM entries")
+        return self.refresh()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    _HOME = os.getenv("HOME")
+    _ICE_DIR = "{0}/.local/share/ice".format(_HOME)
+
+    parser = argparse.ArgumentParser(description="Ice SSB catalog")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop the index and rescan every file")
+    parser.add_argument("--db", default="{0}/catalog.db".format(_ICE_DIR))
+    parser.add_argument("--apps-dir",
+                        default="{0}/.local/share/applications".format(_HOME))
+    args = parser.parse_args()
+
+    catalog = Catalog(args.db, args.apps_dir)
+    if args.rebuild:
+        apps = catalog.rebuild()
+    else:
+        apps = catalog.refresh()
+
+    for app in apps:
+        print("{0}\t{1}".format(app.name, app.path))
+    sys.exit(0)
@@ -8,18 +8,116 @@ profiles for web browsing
 Author: darkoverlordofdata@gmail.com
 """
 
+import os
 import sys
-from PyQt5.QtCore import Qt
+import threading
+
+import browsers
+import ssb
+from PyQt5.QtCore import (Qt, QObject, QRunnable, QThreadPool,
+                          pyqtSignal)
 from PyQt5.QtWidgets import (QDesktopWidget, QWidget, QPushButton,
                              QCheckBox, QGroupBox, QRadioButton,
                              QLabel, QLineEdit,QTextEdit, QGridLayout,
-                             QHBoxLayout, QVBoxLayout, QApplication)
+                             QHBoxLayout, QVBoxLayout, QProgressBar,
+                             QApplication)
+
+class Cancelled(Exception):
+    pass
+
+
+class CreateSignals(QObject):
+    # step number (of CreateJob.STEPS) and what is being done
+    progress = pyqtSignal(int, str)
+    # path of the new .desktop file, and a warning or ""
+    finished = pyqtSignal(str, str)
+    # what went wrong (an ssb.SSBError kind) and the message
+    failed = pyqtSignal(str, str)
+    cancelled = pyqtSignal()
+
+
+class CreateJob(QRunnable):
+    """
+    Creates one app off the GUI thread: checks the name, fetches the
+    page to validate the url, gets the favicon and writes the app.
+    Every step is reported through signals; cancel() stops the job
+    before the next step.
+    """
+
+    STEPS = 4
+
+    def __init__(self, name, url, browser, useFavIcon, iconPath):
+        super().__init__()
+        self.name = name
+        self.url = url
+        self.browser = browser
+        self.useFavIcon = useFavIcon
+        self.iconPath = iconPath
+        self.signals = CreateSignals()
+        self.stop = threading.Event()
+
+    def cancel(self):
+        self.stop.set()
+
+    def run(self):
+        try:
+            self.create()
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except ssb.SSBError as e:
+            self.signals.failed.emit(e.kind, str(e))
+        except Exception as e:
+            self.signals.failed.emit("Error", str(e))
+
+    def step(self, n, text):
+        if self.stop.is_set():
+            raise Cancelled()
+        self.signals.progress.emit(n, text)
+
+    def create(self):
+        # requests and the favicon code load on the first create, not
+        # before the window shows
+        import favicon
+        import webclient
+
+        self.step(0, "Checking the name")
+        ssb.check(self.name)
+        url = ssb.normalize(self.url)
+
+        self.step(1, "Opening " + url)
+        page = webclient.client().page(url)
+        if page is None:
+            raise ssb.SSBError("URL", "Cannot open " + url)
+
+        warning = ""
+        iconPath = self.iconPath or ssb.ICE_ICON
+        if self.useFavIcon:
+            self.step(2, "Fetching the site icon")
+            found = favicon.FaviconCache(ssb.FAVICON_DIR).get(
+                url, lambda: page.head, session=webclient.client().session
+            )
+            if found is None:
+                warning = "No site icon found, using the stock icon"
+            else:
+                iconPath = found
+        elif self.iconPath and not os.path.isfile(self.iconPath):
+            raise ssb.SSBError("Icon", "Icon not found: " + self.iconPath)
+
+        self.step(3, "Creating " + self.name)
+        appfile = ssb.create(self.name, url, self.browser, "Network;",
+                             iconPath, isolate=True)
+        # done; too late to cancel
+        self.signals.progress.emit(self.STEPS, "Created " + self.name)
+        self.signals.finished.emit(appfile, warning)
+
 
 class Cloudz(QWidget):
 
     def __init__(self):
         super().__init__()
 
+        self.pool = QThreadPool.globalInstance()
+        self.job = None
         self.initUI()
 
     def initUI(self):
@@ -28,37 +126,47 @@ class Cloudz(QWidget):
         appName = QLabel('App Name')
         iconPath = QLabel('Icon')
 
-        webUrlEdit = QLineEdit()
-        appNameEdit = QLineEdit()
-        iconPathEdit = QLineEdit()
+        self.webUrlEdit = QLineEdit()
+        self.appNameEdit = QLineEdit()
+        self.iconPathEdit = QLineEdit()
 
         grid = QGridLayout()
         grid.setSpacing(10)
 
         grid.addWidget(webUrl, 1, 0)
-        grid.addWidget(webUrlEdit, 1, 1)
+        grid.addWidget(self.webUrlEdit, 1, 1)
 
         grid.addWidget(appName, 2, 0)
-        grid.addWidget(appNameEdit, 2, 1)
+        grid.addWidget(self.appNameEdit, 2, 1)
 
-        cb = QCheckBox('FavIcon?', self)
-        cb.move(20, 20)
-        cb.toggle()
-        cb.stateChanged.connect(self.useFavIcon)
-        grid.addWidget(cb, 3, 1)
+        self.favIconBox = QCheckBox('FavIcon?', self)
+        self.favIconBox.move(20, 20)
+        self.favIconBox.toggle()
+        self.favIconBox.stateChanged.connect(self.useFavIcon)
+        grid.addWidget(self.favIconBox, 3, 1)
 
         grid.addWidget(iconPath, 4, 0)
-        grid.addWidget(iconPathEdit, 4, 1)
+        grid.addWidget(self.iconPathEdit, 4, 1)
+        self.useFavIcon(self.favIconBox.checkState())
 
         grid.addWidget(self.createBrowserGroup(), 5, 1)
 
-        cancelButton = QPushButton("Cancel")
-        okButton = QPushButton("Create")
+        self.progress = QProgressBar()
+        self.progress.setRange(0, CreateJob.STEPS)
+        self.progress.setVisible(False)
+        self.status = QLabel('')
+        grid.addWidget(self.progress, 6, 1)
+        grid.addWidget(self.status, 7, 1)
+
+        self.cancelButton = QPushButton("Cancel")
+        self.okButton = QPushButton("Create")
+        self.okButton.clicked.connect(self.createApp)
+        self.cancelButton.clicked.connect(self.cancel)
 
         hbox = QHBoxLayout()
         hbox.addStretch(1)
-        hbox.addWidget(okButton)
-        hbox.addWidget(cancelButton)
+        hbox.addWidget(self.okButton)
+        hbox.addWidget(self.cancelButton)
 
         vbox = QVBoxLayout()
         vbox.addStretch(1)
@@ -74,30 +182,91 @@ class Cloudz(QWidget):
 
 
     def useFavIcon(self, state):
-        pass
-        
+        self.iconPathEdit.setEnabled(state != Qt.Checked)
 
-    def createBrowserGroup(self):
-        groupBox = QGroupBox("Select Browser:")
 
-        radio1 = QRadioButton("&Chrome")
-        radio2 = QRadioButton("C&hromium")
-        radio3 = QRadioButton("&Vivaldi")
-        radio4 = QRadioButton("&Firefox")
+    def createApp(self):
+        browser = self.selectedBrowser()
+        if browser is None:
+            self.status.setText("Select a browser")
+            return
+
+        self.job = CreateJob(self.appNameEdit.text().strip(),
+                             self.webUrlEdit.text().strip(), browser,
+                             self.favIconBox.isChecked(),
+                             self.iconPathEdit.text().strip())
+        self.job.signals.progress.connect(self.createProgress)
+        self.job.signals.finished.connect(self.createFinished)
+        self.job.signals.failed.connect(self.createFailed)
+        self.job.signals.cancelled.connect(self.createCancelled)
+
+        self.okButton.setEnabled(False)
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.pool.start(self.job)
+
 
-        radio1.setChecked(True)
+    def cancel(self):
+        # Cancel stops a running create; otherwise it closes the window
+        if self.job is not None:
+            self.job.cancel()
+            self.status.setText("Cancelling...")
+        else:
+            self.close()
 
+
+    def createProgress(self, step, text):
+        self.progress.setValue(step)
+        self.status.setText(text)
+
+
+    def createFinished(self, appfile, warning):
+        self.createDone(warning or "Created " + os.path.basename(appfile))
+        self.appNameEdit.clear()
+        self.webUrlEdit.clear()
+
+
+    def createFailed(self, kind, message):
+        self.createDone(message)
+
+
+    def createCancelled(self):
+        self.createDone("Cancelled")
+
+
+    def createDone(self, text):
+        self.job = None
+        self.progress.setVisible(False)
+        self.okButton.setEnabled(True)
+        self.status.setText(text)
+
+
+    def createBrowserGroup(self):
+        groupBox = QGroupBox("Select Browser:")
+
+        # the same browsers, in the same order, as Ice
+        self.browserButtons = {}
+        selected = browsers.default()
         vbox = QVBoxLayout()
-        vbox.addWidget(radio1)
-        vbox.addWidget(radio2)
-        vbox.addWidget(radio3)
-        vbox.addWidget(radio4)
+        for browser in browsers.TABLE:
+            radio = QRadioButton(browser.qt_label)
+            radio.setEnabled(browsers.installed(browser.key))
+            radio.setChecked(browser.key == selected)
+            vbox.addWidget(radio)
+            self.browserButtons[browser.key] = radio
         vbox.addStretch(1)
         groupBox.setLayout(vbox)
 
         return groupBox
 
 
+    def selectedBrowser(self):
+        for key, radio in self.browserButtons.items():
+            if radio.isChecked():
+                return key
+        return None
+
+
     def center(self):
 
         qr = self.frameGeometry()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Optional settings for Ice, read from ~/.local/share/ice/ice.conf.
+#
+#   [favicons]
+#   max_bytes = 8388608
+#   offline = false
+#
+# Any value can be overridden from the environment as ICE_<SECTION>_<KEY>,
+# e.g. ICE_FAVICONS_OFFLINE=1.
+
+import configparser
+import os
+
+_HOME = os.getenv("HOME")
+CONFIG_FILE = "{0}/.local/share/ice/ice.conf".format(_HOME)
+
+_DEFAULTS = {
+    "favicons": {
+        # byte cap of the favicon cache before LRU eviction kicks in
+        "max_bytes": "8388608",
+        # seconds a cached favicon is used without revalidating it
+        "fresh_for": "86400",
+        # serve cached favicons only, never touch the network
+        "offline": "false",
+    },
+    "http": {
+        # print how many requests were made (and saved) on exit
+        "stats": "false",
+    },
+    "ramprofile": {
+        # launch isolated Chromium and Firefox SSBs with the profile in RAM
+        "enabled": "false",
+        # seconds between write-backs of changed profile files
+        "interval": "300",
+        # "stat" compares mtime and size, "hash" also skips touched files
+        # whose content did not change
+        "compare": "stat",
+        # files modified less than this many seconds ago wait for the
+        # next sync (the final sync at exit takes everything)
+        "settle": "2",
+    },
+    "cachetrim": {
+        # bytes the caches of all isolated SSB profiles may use together
+        "budget": "1073741824",
+        # cache entries younger than this (seconds) are never removed
+        "min_age": "300",
+    },
+    "prefetch": {
+        # seconds between looks at the running SSBs
+        "interval": "1",
+        # seconds between prefetch rounds
+        "refresh": "1800",
+        # bytes read ahead per round
+        "budget": "268435456",
+    },
+    "watcher": {
+        # follow changes to the SSB and profile directories with inotify;
+        # false polls instead (for home directories on NFS)
+        "inotify": "true",
+        # seconds between looks when polling
+        "poll": "2",
+        # seconds to gather events before reporting them
+        "settle": "0.2",
+    },
+    "desktopdb": {
+        # seconds without .desktop changes before the desktop database
+        # and menu are refreshed
+        "delay": "1",
+    },
+}
+
+_parser = None
+
+
+def settings():
+    global _parser
+    if _parser is None:
+        _parser = configparser.ConfigParser()
+        _parser.read_dict(_DEFAULTS)
+        _parser.read(CONFIG_FILE)
+    return _parser
+
+
+def get(section, key):
+    env = "ICE_{0}_{1}".format(section, key).upper()
+    if env in os.environ:
+        return os.environ[env]
+    return settings().get(section, key)
+
+
+def getint(section, key):
+    return int(get(section, key))
+
+
+def getfloat(section, key):
+    return float(get(section, key))
+
+
+def getboolean(section, key):
+    return get(section, key).strip().lower() in ("1", "yes", "true", "on")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Refreshes the desktop database once per batch of .desktop changes.
+#
+# Every SSB has MimeType= entries, so the mimeinfo.cache that
+# update-desktop-database writes into ~/.local/share/applications goes
+# stale when one is added or removed, and rewriting that cache is itself
+# a change the menu notices. Instead of a refresh per file, changed()
+# (re)starts a timer and the refresh runs once nothing has changed for
+# [desktopdb] delay seconds; inside a batch() block it waits for the end
+# of the block. Whatever is still pending when the process exits is run
+# then.
+#
+#   desktopdb.py        refresh now
+
+import atexit
+import shutil
+import subprocess
+import sys
+import threading
+
+import config
+
+
+class Refresher:
+
+    def __init__(self, apps_dir, delay=None,
+                 commands=(("update-desktop-database", "-q", "{apps_dir}"),
+                           ("xdg-desktop-menu", "forceupdate"))):
+        self.apps_dir = apps_dir
+        self.delay = config.getfloat("desktopdb", "delay") \
+            if delay is None else delay
+        self.commands = commands
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending = False
+        self.held = 0
+        # refreshes run, for the benchmark
+        self.runs = 0
+
+    def changed(self):
+        with self.lock:
+            self.pending = True
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.held == 0:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def batch(self):
+        return _Batch(self)
+
+    def hold(self):
+        # No refresh until release(); for batches that do not fit in a
+        # with block
+        with self.lock:
+            self.held += 1
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def release(self):
+        # Returns True when that was the last hold
+        with self.lock:
+            self.held -= 1
+            return self.held == 0
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return False
+            self.pending = False
+            self.runs += 1
+        self.run()
+        return True
+
+    def run(self):
+        for command in self.commands:
+            if shutil.which(command[0]) is None:
+                continue
+            args = [arg.format(apps_dir=self.apps_dir) for arg in command]
+            try:
+                subprocess.run(args, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, timeout=60)
+            except (OSError, subprocess.SubprocessError):
+                pass
+
+
+class _Batch:
+    # Holds refreshes back until the outermost block ends
+
+    def __init__(self, refresher):
+        self.refresher = refresher
+
+    def __enter__(self):
+        self.refresher.hold()
+        return self.refresher
+
+    def __exit__(self, *exc):
+        if self.refresher.release():
+            self.refresher.flush()
+        return False
+
+
+_refreshers = []
+_lock = threading.Lock()
+
+
+def refresher(apps_dir):
+    # called from worker threads too
+    with _lock:
+        for existing in _refreshers:
+            if existing.apps_dir == apps_dir:
+                return existing
+        created = Refresher(apps_dir)
+        _refreshers.append(created)
+        return created
+
+
+@atexit.register
+def _flush_all():
+    with _lock:
+        pending = list(_refreshers)
+    for existing in pending:
+        existing.flush()
+
+
+if __name__ == '__main__':
+    import ssb
+
+    menu = refresher(ssb.APPS_DIR)
+    menu.changed()
+    menu.flush()
+    sys.exit(0)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Reader for the .desktop files written by Ice.
+#
+# Every caller that needs to know what an SSB is (the catalog, the
+# Remove page, deletion and orphaned profile cleanup) goes through
+# parse(), which reads the file once, looks at whole keys only (so
+# GenericName= is not mistaken for Name=) and keeps no state between
+# calls, so it is safe to use from worker threads.
+
+import os
+
+_KEYS = frozenset(("Name", "Icon", "Exec", "StartupWMClass", "IceFirefox",
+                   "IceEpiphany", "X-ICE-SSB-Profile"))
+
+# isolation values
+SHARED = ""
+ISOLATED = "isolated"
+FIREFOX = "firefox"
+EPIPHANY = "epiphany"
+
+
+class DesktopEntry:
+    __slots__ = ('path', 'name', 'icon', 'profile', 'browser',
+                 'isolation', 'exec_line')
+
+    def __init__(self, path, name, icon, profile, browser, isolation,
+                 exec_line):
+        self.path = path
+        self.name = name
+        self.icon = icon
+        self.profile = profile
+        self.browser = browser
+        self.isolation = isolation
+        self.exec_line = exec_line
+
+    def __repr__(self):
+        return "DesktopEntry({0!r}, {1!r})".format(self.path, self.name)
+
+    def astuple(self):
+        return (self.path, self.name, self.icon, self.profile,
+                self.browser, self.isolation, self.exec_line)
+
+
+def parse_text(path, text):
+    # Only the [Desktop Entry] group counts; desktop actions further down
+    # have Name= and Exec= keys of their own.
+    start = text.find("[Desktop Entry]")
+    if start < 0:
+        return None
+    end = text.find("\n[", start)
+    if end < 0:
+        end = len(text)
+
+    keys = {}
+    for line in text[start:end].splitlines():
+        key, sep, value = line.partition("=")
+        if key in _KEYS and key not in keys:
+            keys[key] = value.strip()
+
+    wmclass = keys.get("StartupWMClass", "")
+    # StartupWMClass=Chromium is for legacy apps
+    if not wmclass.startswith(("ICE-SSB", "Chromium")):
+        return None
+
+    name = keys.get("Name", "")
+    icon = keys.get("Icon", "")
+    if name == "" or icon == "":
+        return None
+
+    exec_line = keys.get("Exec", "")
+    command = exec_line
+    # "python3 .../ramprofile.py <profile> -- <browser> ..."
+    if "ramprofile.py " in command and " -- " in command:
+        command = command.split(" -- ", 1)[1]
+    browser = os.path.basename(command.split(" ", 1)[0])
+
+    if "IceFirefox" in keys:
+        profile, isolation = keys["IceFirefox"], FIREFOX
+    elif "IceEpiphany" in keys:
+        profile, isolation = keys["IceEpiphany"], EPIPHANY
+    elif "X-ICE-SSB-Profile" in keys:
+        profile, isolation = keys["X-ICE-SSB-Profile"], ISOLATED
+    else:
+        profile, isolation = "", SHARED
+
+    return DesktopEntry(path, name, icon, profile, browser, isolation,
+                        exec_line)
+
+
+def parse(path):
+    with open(path, 'rb') as f:
+        return parse_text(path, f.read().decode('utf-8', 'ignore'))
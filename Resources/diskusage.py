@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#
+# Disk space used by each Ice SSB: its browser profile (isolated Chromium,
+# Firefox or GNOME Web) plus its icon.
+#
+# Profile trees are walked with os.scandir, one SSB per worker thread.
+# For every directory the names of the files directly in it and the list
+# of its subdirectories are cached against the directory's mtime, so a
+# directory whose entries did not change is not listed again. The files
+# themselves are stat'ed on every scan: one that grows in place (an
+# SQLite database) leaves the directory's mtime alone. --full ignores the
+# cache.
+#
+#   diskusage.py [--full]
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+
+import catalog
+import icontheme
+import ssb
+
+DU_CACHE = "{0}/diskusage.json".format(ssb.ICE_DIR)
+
+
+class DiskUsage:
+
+    def __init__(self, cache_path=DU_CACHE, workers=8):
+        self.cache_path = cache_path
+        self.workers = workers
+        # directory -> [mtime_ns, [file names], [subdirectories]]
+        self.cache = {}
+        if cache_path is not None:
+            try:
+                with open(cache_path) as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+        self.seen = set()
+
+    def directory(self, path):
+        total = 0
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime = os.stat(current).st_mtime_ns
+            except OSError:
+                continue
+            self.seen.add(current)
+            cached = self.cache.get(current)
+            # caches from before file names were kept hold a byte count
+            if cached is None or cached[0] != mtime or \
+                    not isinstance(cached[1], list):
+                cached = self.read(current, mtime)
+            for name in cached[1]:
+                try:
+                    st = os.stat("{0}/{1}".format(current, name),
+                                 follow_symlinks=False)
+                except OSError:
+                    continue
+                total += st.st_blocks * 512
+            stack.extend(cached[2])
+        return total
+
+    def read(self, path, mtime):
+        files = []
+        subdirs = []
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    files.append(entry.name)
+            except OSError:
+                continue
+        cached = self.cache[path] = [mtime, files, subdirs]
+        return cached
+
+    def app(self, details):
+        total = 0
+        path = ssb.profile_dir(details)
+        if path is not None:
+            total += self.directory(path)
+        # epiphany keeps its icon inside the profile
+        icons = []
+        if details.icon.startswith(ssb.ICON_DIR + "/"):
+            icons.append(details.icon)
+        elif details.icon.startswith(icontheme.PREFIX):
+            icons = [icontheme.icon_file(details.icon, size)
+                     for size in icontheme.SIZES]
+            formatted = details.icon[len(icontheme.PREFIX):]
+            icons.append(ssb.icon_source(formatted) or "")
+        for icon in icons:
+            try:
+                total += os.stat(icon).st_blocks * 512
+            except OSError:
+                pass
+        return total
+
+    def scan(self, apps):
+        # Returns {.desktop path: bytes}
+        self.seen = set()
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            sizes = dict(zip([app.path for app in apps],
+                             pool.map(self.app, apps)))
+        self.save()
+        return sizes
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        # forget directories that were not visited (removed SSBs)
+        cache = {path: value for path, value in self.cache.items()
+                 if path in self.seen}
+        tmp = "{0}.{1}.tmp".format(self.cache_path, os.getpid())
+        try:
+            with open(tmp, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Disk space used by each Ice SSB"
+    )
+    parser.add_argument("--full", action="store_true",
+                        help="ignore cached directory listings")
+    args = parser.parse_args()
+
+    apps = catalog.Catalog(ssb.CATALOG_DB, ssb.APPS_DIR).refresh()
+    usage = DiskUsage(None if args.full else DU_CACHE)
+    sizes = usage.scan(apps)
+
+    for app in sorted(apps, key=lambda app: sizes[app.path], reverse=True):
+        print("{0:>10}  {1}".format(ssb.human_size(sizes[app.path]),
+                                    app.name))
+    print("{0:>10}  total for {1} SSBs".format(
+        ssb.human_size(sum(sizes.values())), len(apps)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+#
+# Favicon discovery for "Use site favicon".
+#
+# Every place a site may advertise an icon (og:image, the <link rel>
+# variants and /favicon.ico) is collected up front and probed at the
+# same time under one deadline. The best ranked icon that arrived in
+# time wins; as soon as one is good enough the remaining downloads are
+# abandoned. Google's s2 service is asked only when none of the site's
+# own icons could be used, with whatever time is left.
+#
+# Icon metadata always lives in <head>, so the page is read in chunks and
+# parsed incrementally only until </head> (or <body>, or a byte cap);
+# the rest of a multi-megabyte single page app is never downloaded.
+#
+# Icons are kept in a content addressed cache keyed by origin, so
+# provisioning the same site again only costs a conditional request
+# (or nothing at all while the entry is fresh or when offline).
+
+import codecs
+import concurrent.futures
+import hashlib
+import html.parser
+import os
+import sqlite3
+import struct
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import config
+import webclient
+
+ICON_RELS = ["apple-touch-icon", "shortcut icon", "icon",
+             "msapplication-TileImage"]
+_RELS = [rel.lower() for rel in ICON_RELS]
+
+# Preferred formats, best first
+FORMATS = ["svg", "png", "ico", "gif", "jpg"]
+
+# Icons this size and up are as good as it gets for a launcher icon
+_GOOD_SIZE = 128
+_MAX_BYTES = 4 * 1024 * 1024
+_CHUNK = 16 * 1024
+_HEAD_MAX_BYTES = 512 * 1024
+
+
+class Candidate:
+    __slots__ = ('url', 'order', 'declared', 'data', 'ext', 'size', 'etag',
+                 'modified')
+
+    def __init__(self, url, order, declared=0):
+        self.url = url
+        self.order = order
+        self.declared = declared
+        self.data = None
+        self.ext = None
+        self.size = 0
+        self.etag = None
+        self.modified = None
+
+    def rank(self):
+        # Bigger is better up to _GOOD_SIZE, then format preference, then
+        # the order the site (or the old sequential lookup) listed it in.
+        return (min(self.size, _GOOD_SIZE),
+                len(FORMATS) - FORMATS.index(self.ext),
+                -self.order)
+
+    def good(self):
+        return self.size >= _GOOD_SIZE and self.ext in ("svg", "png")
+
+
+def origin_of(url):
+    parsed = urllib.parse.urlparse(url)
+    return "{0}://{1}".format(parsed.scheme, parsed.netloc)
+
+
+def declared_size(sizes):
+    best = 0
+    for size in (sizes or "").lower().split():
+        if size == "any":
+            return _GOOD_SIZE
+        width, _, height = size.partition("x")
+        if width.isdigit() and height.isdigit():
+            best = max(best, min(int(width), int(height)))
+    return best
+
+
+class HeadParser(html.parser.HTMLParser):
+
+    def __init__(self):
+        html.parser.HTMLParser.__init__(self, convert_charrefs=True)
+        self.done = False
+        self.base = None
+        self.og_image = None
+        # (rel priority, document order, href, declared size)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.done = True
+            return
+        if tag not in ("link", "meta", "base"):
+            return
+        attrs = dict(attrs)
+
+        if tag == "base":
+            if self.base is None and attrs.get("href"):
+                self.base = attrs["href"]
+        elif tag == "meta":
+            content = attrs.get("content")
+            if not content:
+                return
+            if (attrs.get("property") or "").lower() == "og:image":
+                if self.og_image is None:
+                    self.og_image = content
+            elif (attrs.get("name") or "").lower() == \
+                    "msapplication-tileimage":
+                self.add(_RELS.index("msapplication-tileimage"), content, "")
+        else:
+            rel = (attrs.get("rel") or "").lower()
+            href = attrs.get("href")
+            if not href:
+                return
+            # rel is a token list ("shortcut icon"); like the lookup it
+            # replaces, match the whole value or any single token.
+            tokens = [rel] + rel.split()
+            found = [_RELS.index(t) for t in tokens if t in _RELS]
+            if found:
+                self.add(min(found), href, attrs.get("sizes"))
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.done = True
+
+    def add(self, priority, href, sizes):
+        self.links.append((priority, len(self.links), href,
+                           declared_size(sizes)))
+
+
+def parse_head(chunks, max_bytes=_HEAD_MAX_BYTES):
+    # chunks is the page as bytes or as an iterable of byte chunks (a
+    # response being read); iteration stops as soon as <head> is over.
+    if isinstance(chunks, (bytes, bytearray)):
+        chunks = [chunks]
+
+    parser = HeadParser()
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    total = 0
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        total += len(chunk)
+        if parser.done or total >= max_bytes:
+            break
+    return parser
+
+
+def collect(page_url, page):
+    origin = origin_of(page_url)
+    head = parse_head(page)
+    base = page_url
+    if head.base is not None:
+        base = urllib.parse.urljoin(page_url, head.base)
+
+    links = []
+    if head.og_image is not None:
+        links.append((head.og_image, 0))
+    for priority, order, href, declared in sorted(head.links):
+        links.append((href, declared))
+
+    found = []
+    seen = set()
+    for href, declared in links + [(origin + "/favicon.ico", 0)]:
+        url = urllib.parse.urljoin(base, href)
+        if url not in seen:
+            seen.add(url)
+            found.append(Candidate(url, len(found), declared))
+    return found
+
+
+def fallback(page_url):
+    # Google's rendition of the icon, for sites that serve none of their
+    # own
+    parsed = urllib.parse.urlparse(page_url)
+    return Candidate("https://www.google.com/s2/favicons?sz=64&domain=" +
+                     parsed.netloc, 0)
+
+
+def sniff(data):
+    # Returns (extension, pixel size) for the image formats browsers use
+    # as icons, or (None, 0) for anything else (error pages and so on).
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return "png", min(width, height)
+    if data[:4] == b"\x00\x00\x01\x00" and len(data) >= 6:
+        count = struct.unpack("<H", data[4:6])[0]
+        size = 0
+        for i in range(count):
+            entry = data[6 + 16 * i:8 + 16 * i]
+            if len(entry) < 2:
+                break
+            # 0 means 256 in ICO directory entries
+            size = max(size, min(entry[0] or 256, entry[1] or 256))
+        return "ico", size
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return "gif", min(width, height)
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg", _jpeg_size(data)
+    head = data[:512].lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and
+                                    b"<svg" in head):
+        return "svg", _GOOD_SIZE
+    return None, 0
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xff:
+            return 0
+        marker = data[i + 1]
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return min(width, height)
+        i += 2 + length
+    return 0
+
+
+def read_body(r, deadline, cancelled=None):
+    # The body of a streamed response, or None once it passes the
+    # deadline or _MAX_BYTES or the lookup is cancelled
+    chunks = []
+    total = 0
+    for chunk in r.iter_content(_CHUNK):
+        if (cancelled is not None and cancelled.is_set()) or \
+                time.monotonic() > deadline:
+            return None
+        chunks.append(chunk)
+        total += len(chunk)
+        if total > _MAX_BYTES:
+            return None
+    return b"".join(chunks)
+
+
+def fetch(session, candidate, deadline, cancelled):
+    timeout = max(0.1, deadline - time.monotonic())
+    with session.get(candidate.url, timeout=timeout, stream=True) as r:
+        if r.status_code != 200:
+            return candidate
+        candidate.etag = r.headers.get("ETag")
+        candidate.modified = r.headers.get("Last-Modified")
+        data = read_body(r, deadline, cancelled)
+    if data is None:
+        return candidate
+    candidate.ext, candidate.size = sniff(data)
+    if candidate.ext is not None:
+        candidate.data = data
+    return candidate
+
+
+def discover(page_url, page, timeout=5.0, session=None, workers=6):
+    deadline = time.monotonic() + timeout
+    candidates = collect(page_url, page)
+    cancelled = threading.Event()
+    if session is None:
+        session = webclient.client().session
+
+    best = None
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {pool.submit(fetch, session, c, deadline, cancelled)
+                   for c in candidates}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=remaining,
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                try:
+                    candidate = future.result()
+                except (requests.RequestException, ValueError):
+                    continue
+                if candidate.data is None:
+                    continue
+                if best is None or candidate.rank() > best.rank():
+                    best = candidate
+            if best is not None and best.good():
+                break
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if best is None and time.monotonic() < deadline:
+        try:
+            candidate = fetch(session, fallback(page_url), deadline,
+                              threading.Event())
+        except (requests.RequestException, ValueError):
+            return None
+        if candidate.data is not None:
+            best = candidate
+    return best
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS icons (
+    origin TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    modified TEXT,
+    checked REAL NOT NULL,
+    used REAL NOT NULL
+)
+"""
+
+
+class FaviconCache:
+
+    def __init__(self, cache_dir, max_bytes=None, fresh_for=None,
+                 offline=None):
+        if max_bytes is None:
+            max_bytes = config.getint("favicons", "max_bytes")
+        if fresh_for is None:
+            fresh_for = config.getfloat("favicons", "fresh_for")
+        if offline is None:
+            offline = config.getboolean("favicons", "offline")
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.offline = offline
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        with self.connect() as db:
+            db.execute(_SCHEMA)
+
+    def connect(self):
+        return sqlite3.connect("{0}/index.db".format(self.cache_dir),
+                               timeout=10)
+
+    def blobpath(self, blob, ext):
+        return "{0}/{1}.{2}".format(self.cache_dir, blob, ext)
+
+    def lookup(self, origin):
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT url, blob, ext, size, etag, modified, checked"
+                " FROM icons WHERE origin = ?", (origin,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self.blobpath(row[1], row[2])):
+                db.execute("DELETE FROM icons WHERE origin = ?", (origin,))
+                return None
+            db.execute("UPDATE icons SET used = ? WHERE origin = ?",
+                       (time.time(), origin))
+        return dict(zip(("url", "blob", "ext", "size", "etag", "modified",
+                         "checked"), row))
+
+    def store(self, origin, candidate):
+        # Returns the cached file, or None for an icon bigger than the
+        # whole cache
+        if len(candidate.data) > self.max_bytes:
+            return None
+        blob = hashlib.sha256(candidate.data).hexdigest()
+        path = self.blobpath(blob, candidate.ext)
+
+        # the file and its row appear together, so evict() running for
+        # another thread cannot take a file that has no row yet
+        now = time.time()
+        with self.lock, self.connect() as db:
+            if not os.path.exists(path):
+                tmp = "{0}.{1}.tmp".format(path, threading.get_ident())
+                with open(tmp, "wb") as f:
+                    f.write(candidate.data)
+                os.replace(tmp, path)
+            db.execute(
+                "INSERT OR REPLACE INTO icons VALUES"
+                " (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (origin, candidate.url, blob, candidate.ext, candidate.size,
+                 candidate.etag, candidate.modified, now, now)
+            )
+            self.evict(db, blob)
+        return path
+
+    def revalidate(self, origin, entry, session, timeout):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["modified"]:
+            headers["If-Modified-Since"] = entry["modified"]
+
+        deadline = time.monotonic() + timeout
+        with session.get(entry["url"], headers=headers, timeout=timeout,
+                         stream=True) as r:
+            if r.status_code == 304:
+                with self.connect() as db:
+                    db.execute("UPDATE icons SET checked = ? "
+                               "WHERE origin = ?", (time.time(), origin))
+                return self.blobpath(entry["blob"], entry["ext"])
+
+            if r.status_code != 200:
+                return None
+            candidate = Candidate(entry["url"], 0)
+            candidate.etag = r.headers.get("ETag")
+            candidate.modified = r.headers.get("Last-Modified")
+            data = read_body(r, deadline)
+        if data is None:
+            return None
+        candidate.ext, candidate.size = sniff(data)
+        if candidate.ext is None:
+            return None
+        candidate.data = data
+        return self.store(origin, candidate)
+
+    def get(self, page_url, fetch_page, timeout=5.0, session=None):
+        # Returns the path of a cached icon for page_url's origin, going
+        # to the network only when the entry is missing or stale.
+        # fetch_page is called (and only then) when the page itself has to
+        # be read to discover icons.
+        origin = origin_of(page_url)
+        entry = self.lookup(origin)
+
+        if self.offline:
+            if entry is None:
+                return None
+            return self.blobpath(entry["blob"], entry["ext"])
+
+        if entry is not None:
+            if time.time() - entry["checked"] < self.fresh_for:
+                return self.blobpath(entry["blob"], entry["ext"])
+            if session is None:
+                session = webclient.client().session
+            try:
+                path = self.revalidate(origin, entry, session, timeout)
+            except requests.RequestException:
+                # keep serving the stale icon while the site is unreachable
+                return self.blobpath(entry["blob"], entry["ext"])
+            if path is not None:
+                return path
+
+        page = fetch_page()
+        if page is None:
+            return None
+        best = discover(page_url, page, timeout=timeout, session=session)
+        if best is None:
+            return None
+        return self.store(origin, best)
+
+    def evict(self, db, keep):
+        # keep: the blob just stored, which stays whatever its size
+        rows = db.execute(
+            "SELECT origin, blob, ext, used FROM icons ORDER BY used DESC"
+        ).fetchall()
+
+        sizes = {}
+        for origin, blob, ext, used in rows:
+            if blob not in sizes:
+                try:
+                    sizes[blob] = os.path.getsize(self.blobpath(blob, ext))
+                except OSError:
+                    sizes[blob] = 0
+
+        if sum(sizes.values()) <= self.max_bytes:
+            return
+
+        # Keep the most recently used entries that fit in the budget;
+        # blobs shared by several origins are only counted once.
+        kept = {keep}
+        total = sizes.get(keep, 0)
+        for origin, blob, ext, used in rows:
+            if blob in kept:
+                continue
+            if total + sizes[blob] <= self.max_bytes:
+                kept.add(blob)
+                total += sizes[blob]
+
+        for origin, blob, ext, used in rows:
+            if blob not in kept:
+                db.execute("DELETE FROM icons WHERE origin = ?", (origin,))
+
+        for entry in os.scandir(self.cache_dir):
+            blob = entry.name.partition(".")[0]
+            if len(blob) == 64 and blob not in kept and \
+                    not entry.name.endswith(".tmp"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
@@ -1,32 +1,218 @@
 #!/usr/bin/env python3
+#
+# Launches a Firefox SSB for the address in argv[1] with its own profile
+# under ./profiles/firefox/<address>.
+#
+# The profile is built in-process rather than through a shell per line,
+# and a fingerprint of the prefs, CSS and seed files is kept in the
+# profile: when it still matches, nothing is written and the only
+# process started is Firefox itself. Set ICE_LAUNCH_TIMING=1 to print
+# the launch overhead (and what the old shell based setup would cost).
+#
+# With --ephemeral (or ICE_EPHEMERAL=1) Firefox runs on a throwaway copy
+# of the profile in $XDG_RUNTIME_DIR (or /dev/shm), so a kiosk session
+# causes no disk I/O; the copy is deleted in the background on exit.
+#
+#   ice-firefox.py [--ephemeral] <address>
 
+import hashlib
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 
-sys.argv[1]
-profileid1 = str.replace(sys.argv[1], 'http://', '')
-profileid2 = str.replace(profileid1, 'https://', '')
-profileid = str.replace(profileid2, '/', '_')
-
-profilepath = os.path.expanduser('./profiles/firefox/' + str(profileid))
-chromepath = os.path.expanduser('./profiles/firefox/' + str(profileid) + '/chrome')
-path = os.path.dirname(chromepath)
-
-execute = 'firefox -profile ' + path + ' -no-remote -new-instance' + ' ' + sys.argv[1]
-
-os.system('mkdir -p ' + chromepath)
-os.system('echo "#nav-bar, #identity-box, #tabbrowser-tabs, #TabsToolbar { visibility: collapse !important; }" > ' + chromepath + '/userChrome.css')
-os.system('echo "user_pref(\\"browser.cache.disk.enable\\", false);" > ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.cache.disk.capacity\\", 0);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.cache.disk.filesystem_reported\\", 1);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.cache.disk.smart_size.enabled\\", false);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.cache.disk.smart_size.first_run\\", false);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.cache.disk.smart_size.use_old_max\\", false);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.ctrlTab.previews\\", true);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"browser.tabs.warnOnClose\\", false);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"plugin.state.flash\\", 2);" >> ' + profilepath + '/user.js')
-os.system('echo "user_pref(\\"toolkit.legacyUserProfileCustomizations.stylesheets\\", true);" >> ' + profilepath + '/user.js')
-os.system('cp -n ./search.json.mozlz4 ' + profilepath + '/search.json.mozlz4')
-os.system('cp -n ./places.sqlite ' + profilepath + '/places.sqlite')
-os.system(execute)
-os.system('rm -rf ' + path + '/cache2')
+CSS = ("#nav-bar, #identity-box, #tabbrowser-tabs, #TabsToolbar "
+       "{ visibility: collapse !important; }\n")
+
+PREFS = [
+    'user_pref("browser.cache.disk.enable", false);',
+    'user_pref("browser.cache.disk.capacity", 0);',
+    'user_pref("browser.cache.disk.filesystem_reported", 1);',
+    'user_pref("browser.cache.disk.smart_size.enabled", false);',
+    'user_pref("browser.cache.disk.smart_size.first_run", false);',
+    'user_pref("browser.cache.disk.smart_size.use_old_max", false);',
+    'user_pref("browser.ctrlTab.previews", true);',
+    'user_pref("browser.tabs.warnOnClose", false);',
+    'user_pref("plugin.state.flash", 2);',
+    'user_pref("toolkit.legacyUserProfileCustomizations.stylesheets", true);',
+]
+
+# copied into the profile once, never overwritten (cp -n)
+SEEDS = ["./search.json.mozlz4", "./places.sqlite"]
+
+FINGERPRINT = ".ice-fingerprint"
+
+# mkdir, one echo per user.js line, userChrome.css, two cp -n, rm -rf
+LEGACY_SHELLS = 3 + len(PREFS) + len(SEEDS)
+
+
+def profile_id(url):
+    profileid = str.replace(url, 'http://', '')
+    profileid = str.replace(profileid, 'https://', '')
+    return str.replace(profileid, '/', '_')
+
+
+def fingerprint():
+    h = hashlib.sha256()
+    h.update(CSS.encode())
+    h.update("\n".join(PREFS).encode())
+    for seed in SEEDS:
+        try:
+            st = os.stat(seed)
+        except OSError:
+            h.update(b"missing")
+            continue
+        h.update("{0}:{1}:{2}".format(seed, st.st_size,
+                                      st.st_mtime_ns).encode())
+    return h.hexdigest()
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return 0
+    except OSError:
+        pass
+    with open(path, "w") as f:
+        f.write(content)
+    return 1
+
+
+def materialise(profilepath):
+    # Returns the number of files written (0 on a warm launch)
+    stamp = "{0}/{1}".format(profilepath, FINGERPRINT)
+    wanted = fingerprint()
+    try:
+        with open(stamp) as f:
+            if f.read() == wanted:
+                return 0
+    except OSError:
+        pass
+
+    writes = 0
+    chromepath = profilepath + "/chrome"
+    os.makedirs(chromepath, exist_ok=True)
+    writes += write_if_changed(chromepath + "/userChrome.css", CSS)
+    writes += write_if_changed(profilepath + "/user.js",
+                               "\n".join(PREFS) + "\n")
+    for seed in SEEDS:
+        target = "{0}/{1}".format(profilepath, os.path.basename(seed))
+        if os.path.isfile(seed) and not os.path.exists(target):
+            shutil.copyfile(seed, target)
+            writes += 1
+
+    with open(stamp, "w") as f:
+        f.write(wanted)
+    return writes + 1
+
+
+def runtime_root():
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        root = runtime + "/ice"
+    else:
+        root = "/dev/shm/ice-{0}".format(os.getuid())
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    return root
+
+
+def ephemeral_copy(profilepath, profileid):
+    # Session directories are named <profile id>.<launcher pid>.<random>
+    session = tempfile.mkdtemp(
+        prefix="{0}.{1}.".format(profileid, os.getpid()), dir=runtime_root()
+    )
+    shutil.copytree(profilepath, session, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns("cache2", FINGERPRINT))
+    return session
+
+
+def stale_sessions(root):
+    # Copies left behind by launchers that are gone (crashes, power loss
+    # does not matter on tmpfs)
+    for entry in os.scandir(root):
+        pid = entry.name.rsplit(".", 2)
+        if len(pid) != 3 or not pid[1].isdigit():
+            continue
+        try:
+            os.kill(int(pid[1]), 0)
+        except ProcessLookupError:
+            yield entry.path
+        except PermissionError:
+            pass
+
+
+def discard(session):
+    # Delete the session copy without making the caller wait for it
+    root = os.path.dirname(session)
+    try:
+        pid = os.fork()
+    except OSError:
+        pid = 0
+        background = False
+    else:
+        background = True
+    if pid != 0:
+        return
+
+    if background:
+        os.setsid()
+    shutil.rmtree(session, ignore_errors=True)
+    for path in stale_sessions(root):
+        shutil.rmtree(path, ignore_errors=True)
+    if background:
+        os._exit(0)
+
+
+def shell_cost():
+    start = time.perf_counter()
+    subprocess.call(["/bin/sh", "-c", ":"])
+    return time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    ephemeral = os.getenv("ICE_EPHEMERAL", "") not in ("", "0")
+    if args and args[0] == "--ephemeral":
+        ephemeral = True
+        args.pop(0)
+
+    url = args[0]
+    profileid = profile_id(url)
+    profilepath = os.path.expanduser('./profiles/firefox/' + profileid)
+    timing = os.getenv("ICE_LAUNCH_TIMING")
+
+    start = time.perf_counter()
+    writes = materialise(profilepath)
+    overhead = time.perf_counter() - start
+
+    if timing:
+        sys.stderr.write(
+            "ice-firefox: profile ready in {0:.2f} ms, {1} files written; "
+            "the shell based setup would spawn {2} shells (~{3:.1f} ms)\n"
+            .format(overhead * 1000, writes, LEGACY_SHELLS,
+                    shell_cost() * LEGACY_SHELLS * 1000)
+        )
+
+    if ephemeral:
+        session = ephemeral_copy(profilepath, profileid)
+        try:
+            status = subprocess.call(["firefox", "-profile", session,
+                                      "-no-remote", "-new-instance", url])
+        finally:
+            discard(session)
+        return status
+
+    status = subprocess.call(["firefox", "-profile", profilepath,
+                              "-no-remote", "-new-instance", url])
+
+    # the disk cache is disabled, but clear out anything left behind
+    if os.path.isdir(profilepath + "/cache2"):
+        shutil.rmtree(profilepath + "/cache2", ignore_errors=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,19 +15,26 @@
 # excellent pyfav library that is integrated into this application.
 # ADDENDUM: Added support for Firefox (via "ice-firefox") and Vivaldi.
 
-import bs4
+import concurrent.futures
 import gettext
 import locale
 import os
 import os.path
-import requests
-import shutil
 import string
 import sys
 import threading
-import urllib.error
-import urllib.parse
-import urllib.request
+import time
+
+import browsers
+import catalog
+import config
+import desktopdb
+import desktopentry
+import diskusage
+import orphans
+import ssb
+import thumbnails
+import watcher
 
 import gi
 gi.require_version('Gtk', '3.0')
@@ -35,20 +42,17 @@ from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository.GdkPixbuf import Pixbuf
 
-_HOME = os.getenv("HOME")
-_ICE_DIR = "{0}/.local/share/ice".format(_HOME)
-_APPS_DIR = "{0}/.local/share/applications".format(_HOME)
-_PROFILES_DIR = "{0}/profiles".format(_ICE_DIR)
-_FF_PROFILES_DIR = "{0}/firefox".format(_ICE_DIR)
-_EPIPHANY_PROFILES_DIR = "{0}/epiphany".format(_ICE_DIR)
-_ICE_ICON = "/usr/share/pixmaps/ice.png"
-_ICON_DIR = "{0}/icons".format(_ICE_DIR)
-_BRAVE_BIN = "/usr/bin/brave-browser"
-_CHROME_BIN = "/usr/bin/google-chrome"
-_CHROMIUM_BIN = "/usr/bin/chromium-browser"
-_VIVALDI_BIN = "/usr/bin/vivaldi-stable"
-_FIREFOX_BIN = "/usr/bin/firefox"
-_EPIPHANY_BIN = "/usr/bin/epiphany"
+_HOME = ssb.HOME
+_ICE_DIR = ssb.ICE_DIR
+_APPS_DIR = ssb.APPS_DIR
+_PROFILES_DIR = ssb.PROFILES_DIR
+_FF_PROFILES_DIR = ssb.FF_PROFILES_DIR
+_EPIPHANY_PROFILES_DIR = ssb.EPIPHANY_PROFILES_DIR
+_ICE_ICON = ssb.ICE_ICON
+_ICON_DIR = ssb.ICON_DIR
+_CATALOG_DB = ssb.CATALOG_DB
+_THUMB_DIR = ssb.THUMB_DIR
+_FAVICON_DIR = ssb.FAVICON_DIR
 
 gettext.bindtextdomain(
     'messages',
@@ -58,11 +62,8 @@ gettext.bindtextdomain(
 gettext.textdomain('messages')
 _ = gettext.gettext
 
-# Requisite dirs
-for directory in [_ICE_DIR, _APPS_DIR, _PROFILES_DIR,
-                  _FF_PROFILES_DIR, _ICON_DIR, _EPIPHANY_PROFILES_DIR]:
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+# requests and the favicon code are only needed once a site is
+# contacted, so favicon and webclient are imported on first use.
 
 
 class IconSel(Gtk.FileChooserDialog):
@@ -227,10 +228,7 @@ class Ice(Gtk.Window):
         self.url = Gtk.Entry()
         self.url.set_placeholder_text(_("Enter web address"))
 
-        self.where_store = [_("Accessories"), _("Games"),
-                            _("Graphics"), _("Internet"),
-                            _("Office"), _("Programming"),
-                            _("Multimedia"), _("System")]
+        self.where_store = [_(label) for label, value in ssb.CATEGORIES]
 
         self.where_lab = Gtk.Label(label=_("Where in the menu?"))
         self.where = Gtk.ComboBoxText()
@@ -255,108 +253,24 @@ class Ice(Gtk.Window):
         self.isolate_button.add(self.isolate_lab)
         self.isolate_button.connect("toggled", self.isolate_clicked)
 
-        self.firefox = Gtk.RadioButton.new_with_label_from_widget(None,
-                                                                  "Firefox")
-
-        if not os.path.exists(_FIREFOX_BIN):
-            self.firefox.set_sensitive(False)
-
-        if not os.path.exists(_CHROMIUM_BIN) and not \
-                os.path.exists(_CHROME_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_EPIPHANY_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and \
-                os.path.exists(_FIREFOX_BIN):
-            self.firefox.set_active(True)
-
-        self.firefox.connect("clicked", self.browser_button)
-
-        self.brave = Gtk.RadioButton.new_from_widget(self.firefox)
-        self.brave.set_label("Brave")
-
-        if not os.path.exists(_BRAVE_BIN):
-            self.brave.set_sensitive(False)
-
-        if not os.path.exists(_CHROMIUM_BIN) and not \
-                os.path.exists(_FIREFOX_BIN) and not \
-                os.path.exists(_CHROME_BIN) and not \
-                os.path.exists(_EPIPHANY_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and \
-                os.path.exists(_BRAVE_BIN):
-            self.brave.set_active(True)
-
-        self.brave.connect("clicked", self.browser_button)
-
-        self.chrome = Gtk.RadioButton.new_from_widget(self.brave)
-        self.chrome.set_label("Chrome")
-
-        if not os.path.exists(_CHROME_BIN):
-            self.chrome.set_sensitive(False)
-
-        if not os.path.exists(_CHROMIUM_BIN) and not \
-                os.path.exists(_FIREFOX_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_EPIPHANY_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and \
-                os.path.exists(_CHROME_BIN):
-            self.chrome.set_active(True)
-
-        self.chrome.connect("clicked", self.browser_button)
-
-        self.vivaldi = Gtk.RadioButton.new_from_widget(self.chrome)
-        self.vivaldi.set_label("Vivaldi")
-
-        if not os.path.exists(_VIVALDI_BIN):
-            self.vivaldi.set_sensitive(False)
-
-        if not os.path.exists(_CHROMIUM_BIN) and not \
-                os.path.exists(_FIREFOX_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_EPIPHANY_BIN) and not \
-                os.path.exists(_CHROME_BIN) and \
-                os.path.exists(_VIVALDI_BIN):
-            self.vivaldi.set_active(True)
-
-        self.vivaldi.connect("clicked", self.browser_button)
-
-        self.chromium = Gtk.RadioButton.new_from_widget(self.vivaldi)
-        self.chromium.set_label("Chromium")
-
-        if not os.path.exists(_CHROMIUM_BIN):
-            self.chromium.set_sensitive(False)
-
-        if not os.path.exists(_CHROME_BIN) and not \
-                os.path.exists(_FIREFOX_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_EPIPHANY_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and \
-                os.path.exists(_CHROMIUM_BIN):
-            self.chromium.set_active(True)
-
-        self.chromium.connect("clicked", self.browser_button)
-
-        self.epiphany = Gtk.RadioButton.new_from_widget(self.chromium)
-        self.epiphany.set_label("GNOME Web")
-
-        if not os.path.exists(_EPIPHANY_BIN):
-            self.epiphany.set_sensitive(False)
-
-        if not os.path.exists(_CHROME_BIN) and not \
-                os.path.exists(_FIREFOX_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and not \
-                os.path.exists(_CHROMIUM_BIN) and \
-                os.path.exists(_EPIPHANY_BIN):
-            self.epiphany.set_active(True)
-        
-        self.epiphany.connect("clicked", self.browser_button)
-
-        if self.firefox.get_active() is True:
-            self.isolate_button.set_label(_("Firefox is always isolated"))
-            self.isolate_button.set_sensitive(False)
-        elif self.epiphany.get_active() is True:
-            self.isolate_button.set_label(_("GNOME Web is always isolated"))
-            self.isolate_button.set_sensitive(False)
+        # One radio button per browser in browsers.TABLE; those that are
+        # not installed are shown but greyed out
+        self.radios = {}
+        leader = None
+        selected = browsers.default()
+        for browser in browsers.TABLE:
+            radio = Gtk.RadioButton.new_with_label_from_widget(leader,
+                                                               browser.label)
+            leader = leader or radio
+            if not browsers.installed(browser.key):
+                radio.set_sensitive(False)
+            if browser.key == selected:
+                radio.set_active(True)
+            radio.connect("clicked", self.browser_button)
+            self.radios[browser.key] = radio
+
+        if selected is not None:
+            self.set_isolate_button(selected)
 
         self.apply_button = Gtk.Button(label=_("Apply"))
         self.apply_button.connect("clicked", self.thread_apply_clicked)
@@ -364,12 +278,8 @@ class Ice(Gtk.Window):
         self.browser_box = Gtk.FlowBox()
         self.browser_box.set_row_spacing(0)
         self.browser_box.set_column_spacing(0)
-        self.browser_box.add(self.brave)
-        self.browser_box.add(self.chrome)
-        self.browser_box.add(self.chromium)
-        self.browser_box.add(self.firefox)
-        self.browser_box.add(self.vivaldi)
-        self.browser_box.add(self.epiphany)
+        for browser in browsers.TABLE:
+            self.browser_box.add(self.radios[browser.key])
         
         self.option_box = Gtk.FlowBox()
         self.option_box.set_row_spacing(0)
@@ -394,40 +304,91 @@ class Ice(Gtk.Window):
         ######################
 
         self.known_profiles = []
-        self.liststore = Gtk.ListStore(Pixbuf, str)
+        # icon, name, .desktop path, label shown (name and disk usage)
+        self.liststore = Gtk.ListStore(Pixbuf, str, str, str)
+        self.placeholder = self.load_placeholder()
+        self.thumbnailer = thumbnails.ThumbnailLoader(
+            thumbnails.ThumbnailCache(_THUMB_DIR)
+        )
+        self.thumbnailer.start()
+        self.favicons = None
 
-        for fl in os.listdir(_APPS_DIR):
-            self.a = "{0}/{1}".format(_APPS_DIR, fl)
-            if not os.path.isdir(self.a):
-                self.details = self.get_details(self.a)
-                if self.details is not None:
-                    self.liststore.append([self.details['pixbuf'],
-                                           self.details['nameline']])
-                    self.known_profiles.append(self.details)
+        self.catalog = catalog.Catalog(_CATALOG_DB, _APPS_DIR)
+        if "--rebuild-catalog" in sys.argv:
+            self.apps = self.catalog.rebuild()
+        else:
+            self.apps = self.catalog.refresh()
 
-        self.clean_orphaned_profiles(self.known_profiles)
+        for self.details in self.apps:
+            self.add_app(self.details)
+            self.known_profiles.append(self.details)
 
         self.iconview = Gtk.IconView()
         self.iconview.set_model(self.liststore)
         self.iconview.set_pixbuf_column(0)
-        self.iconview.set_text_column(1)
-        self.iconview.set_selection_mode(1)
+        self.iconview.set_markup_column(3)
+        self.iconview.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
         self.iconview.connect("item-activated", self.delete)
+        self.iconview.connect("selection-changed", self.selection_changed)
 
         self.remove_scroll = Gtk.ScrolledWindow()
         self.remove_scroll.add(self.iconview)
 
+        # Profiles are deleted on a pool of worker threads; the bar shows
+        # how many of the SSBs being removed are done
+        self.delete_pool = None
+        self.delete_total = 0
+        self.delete_done = 0
+        # .desktop paths queued for deletion; the watcher sees them until
+        # the pool gets to them and must not bring their rows back
+        self.deleting = set()
+        self.delete_progress = Gtk.ProgressBar()
+        self.delete_progress.set_show_text(True)
+        self.delete_progress.set_no_show_all(True)
+        self.delete_button = Gtk.Button(label=_("Remove selected"))
+        self.delete_button.set_sensitive(False)
+        self.delete_button.connect("clicked", self.delete)
+
+        self.delete_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.delete_box.pack_start(self.delete_progress, True, True, 5)
+        self.delete_box.pack_end(self.delete_button, False, False, 0)
+
+        self.remove_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.remove_box.pack_start(self.remove_scroll, True, True, 0)
+        self.remove_box.pack_start(self.delete_box, False, False, 5)
+
         self.main_stack.add_titled(self.create_grid, "create", _("Create"))
-        self.main_stack.add_titled(self.remove_scroll, "remove", _("Remove"))
+        self.main_stack.add_titled(self.remove_box, "remove", _("Remove"))
 
         self.add(self.main_stack)
         self.show_all()
 
-        if not os.path.exists(_CHROME_BIN) and not \
-                os.path.exists(_CHROMIUM_BIN) and not \
-                os.path.exists(_VIVALDI_BIN) and not \
-                os.path.exists(_BRAVE_BIN) and not \
-                os.path.exists(_FIREFOX_BIN):
+        # Requisite dirs; creating them can wait until the window is up
+        self.dirs_thread = threading.Thread(target=ssb.ensure_dirs)
+        self.dirs_thread.daemon = True
+        self.dirs_thread.start()
+
+        # and so can clearing out profiles of SSBs that were removed
+        self.orphans_thread = threading.Thread(
+            target=self.clean_orphaned_profiles, args=(self.known_profiles,)
+        )
+        self.orphans_thread.daemon = True
+        self.orphans_thread.start()
+
+        self.du_thread = threading.Thread(target=self.measure_apps,
+                                          args=(self.known_profiles,))
+        self.du_thread.daemon = True
+        self.du_thread.start()
+
+        # SSBs made or removed by other tools show up while Ice is open
+        self.watcher = watcher.Watcher(
+            [_APPS_DIR, _PROFILES_DIR, _FF_PROFILES_DIR,
+             _EPIPHANY_PROFILES_DIR],
+            self.directory_changed
+        )
+        self.watcher.start()
+
+        if selected is None:
             self.apply_button.set_sensitive(False)
             ErrorDialog(
                 "Browser Error",
@@ -452,10 +413,8 @@ class Ice(Gtk.Window):
     def apply_clicked(self):
         if self.errortest(self.normalize(self.url.get_text())) is not None:
             self.applicate()
-        elif self.errortest(self.normalize(self.url.get_text())) is None:
-            GLib.idle_add(self.apply_errors, "address")
         else:
-            GLib.idle_add(self.apply_errors, "unknown")
+            GLib.idle_add(self.apply_errors, "address")
 
     def apply_errors(self, errortype):
         if errortype == "address":
@@ -473,74 +432,134 @@ class Ice(Gtk.Window):
             self.isolate_profile = True
 
     def get_details(self, app):
-        self.a = open(app, 'r', errors='ignore')
-        self.nameline = ""
-        self.iconline = ""
-        self.profile = ""
-        self.is_ice = False
-        self.is_firefox = False
-        self.is_isolated = False
-
-        for line in self.a:
-            if "Name=" in line:
-                self.array = line.replace("=", " ").split()
-                self.array.pop(0)
-                for word in self.array:
-                    self.nameline = self.nameline + word + " "
-            elif "Icon=" in line:
-                self.array = line.replace("=", " ").split()
-                self.array.pop(0)
-                for word in self.array:
-                    self.iconline = self.iconline + word
-                try:
-                    self.pixbuf = Pixbuf.new_from_file_at_size(self.iconline,
-                                                               16, 16)
-                except GLib.Error:
-                    self.pixbuf = Gtk.Image.new_from_icon_name(
-                        "ice",
-                        6
-                    ).get_pixbuf(),
-            elif "StartupWMClass=Chromium" in line:
-                # for legacy apps
-                self.is_ice = True
-            elif "StartupWMClass=ICE-SSB" in line:
-                self.is_ice = True
-            elif "IceFirefox=" in line:
-                self.is_firefox = True
-                self.profile = str.replace(line, 'IceFirefox=', '').strip()
-            elif "X-ICE-SSB-Profile=" in line:
-                self.is_isolated = True
-                self.profile = str.replace(line,
-                                           'X-ICE-SSB-Profile=', '').strip()
-
-        if self.nameline != "" and self.iconline != "" and self.is_ice is True:
-            self.details = {
-                'nameline': self.nameline,
-                'profile': self.profile,
-                'is_firefox': self.is_firefox,
-                'is_isolated': self.is_isolated,
-                'pixbuf': self.pixbuf
-            }
-            return self.details
+        return self.catalog.update(app)
+
+    def load_placeholder(self):
+        try:
+            return Gtk.IconTheme.get_default().load_icon("ice", 16, 0)
+        except GLib.Error:
+            return None
+
+    def add_app(self, details, prepend=False):
+        # Rows start with the stock icon; the real thumbnail is swapped in
+        # by the background loader once it has been decoded.
+        label = GLib.markup_escape_text(details.name)
+        if prepend is True:
+            self.row = self.liststore.prepend([self.placeholder,
+                                               details.name, details.path,
+                                               label])
+        else:
+            self.row = self.liststore.append([self.placeholder,
+                                              details.name, details.path,
+                                              label])
+        self.thumbnailer.request(
+            ssb.icon_path(details.icon, 16), self.set_thumbnail,
+            Gtk.TreeRowReference.new(self.liststore,
+                                     self.liststore.get_path(self.row))
+        )
+
+    def set_thumbnail(self, pixbuf, rowref):
+        if rowref.valid():
+            self.liststore[rowref.get_path()][0] = pixbuf
+        return False
+
+    def measure_apps(self, apps):
+        # Worker thread: disk usage per SSB for the Remove page
+        sizes = diskusage.DiskUsage().scan(apps)
+        GLib.idle_add(self.show_sizes, sizes)
+
+    def show_sizes(self, sizes):
+        for row in self.liststore:
+            if row[2] in sizes:
+                row[3] = "{0}\n<small>{1}</small>".format(
+                    GLib.markup_escape_text(row[1]),
+                    ssb.human_size(sizes[row[2]])
+                )
+        return False
 
+    def find_row(self, path):
+        for row in self.liststore:
+            if row[2] == path:
+                return row.iter
         return None
 
-    def normalize(self, url):
-        (self.scheme, self.netloc,
-         self.path, _, _, _) = urllib.parse.urlparse(url, "http")
+    def show_app(self, details, prepend=False):
+        # Adds the SSB's row, or brings an existing one up to date
+        treeiter = self.find_row(details.path)
+        if treeiter is None:
+            self.add_app(details, prepend)
+            return
+        self.liststore.set(treeiter, [1, 3], [
+            details.name, GLib.markup_escape_text(details.name)
+        ])
+        self.thumbnailer.request(
+            ssb.icon_path(details.icon, 16), self.set_thumbnail,
+            Gtk.TreeRowReference.new(self.liststore,
+                                     self.liststore.get_path(treeiter))
+        )
 
-        if not self.netloc and self.path:
-            return urllib.parse.urlunparse((self.scheme,
-                                            self.path, "", "", "", ""))
+    def directory_changed(self, directory, names):
+        # Watcher thread: runs the catalog and disk usage work for what
+        # changed and hands the result to the main loop
+        if directory == _APPS_DIR:
+            if names is None:
+                # events were lost; the catalog finds what changed
+                apps = []
+                for app in self.catalog.refresh():
+                    if app.path in self.deleting:
+                        # still on disk until the delete pool gets to it
+                        self.catalog.forget(app.path)
+                    else:
+                        apps.append(app)
+                changes = {app.path: app for app in apps}
+            else:
+                changes = {}
+                for name in names:
+                    if not name.endswith(".desktop"):
+                        continue
+                    path = "{0}/{1}".format(directory, name)
+                    if path in self.deleting:
+                        self.catalog.forget(path)
+                        changes[path] = None
+                    else:
+                        changes[path] = self.catalog.update(path)
+                apps = [app for app in changes.values() if app is not None]
+            if changes:
+                GLib.idle_add(self.apply_changes, changes, names is None)
+        else:
+            # a profile was made or removed; measure the SSBs it belongs to
+            apps = []
+            for app in self.catalog.entries():
+                path = ssb.profile_dir(app)
+                if path is not None and os.path.dirname(path) == directory \
+                        and (names is None or
+                             os.path.basename(path) in names):
+                    apps.append(app)
+        if apps:
+            sizes = diskusage.DiskUsage(cache_path=None).scan(apps)
+            GLib.idle_add(self.show_sizes, sizes)
+
+    def apply_changes(self, changes, complete):
+        # changes: {.desktop path: details, or None if it is gone or not
+        # an SSB}; complete means rows not in changes are gone too
+        for row in list(self.liststore):
+            if (row[2] in changes and changes[row[2]] is None) or \
+                    (complete and row[2] not in changes):
+                self.liststore.remove(row.iter)
+        for path, details in changes.items():
+            if details is not None and path not in self.deleting:
+                self.show_app(details)
+        return False
 
-        return urllib.parse.urlunparse((self.scheme, self.netloc,
-                                        self.path, "", "", ""))
+    def normalize(self, url):
+        return ssb.normalize(url)
 
     def errortest(self, url):
-        try:
-            return urllib.request.urlopen(url, timeout=3)
-        except (urllib.request.HTTPError, urllib.request.URLError):
-            return None
+        return self.webclient().page(url)
+
+    def webclient(self):
+        import webclient
+        return webclient.client()
 
     def thread_icon_download(self, button):
         self.download_icon.set_label(_("Downloading favicon"))
@@ -550,84 +569,55 @@ class Ice(Gtk.Window):
 
     def icon_download(self):
         self.appurl = self.normalize(self.url.get_text())
-        self.parsed_uri = urllib.parse.urlparse(self.appurl)
-        self.iconformats = ["apple-touch-icon", "shortcut icon",
-                            "icon", "msapplication-TileImage"]
-        self.icon_link = None
-        self.page = self.errortest(self.appurl)
-
-        if self.page is not None:
-            self.soup = bs4.BeautifulSoup(self.page.read(), "html.parser")
-
-            og_image = self.soup.find("meta", {"property": "og:image"})
-            if og_image is not None:
-                og_image = og_image["content"]
-                if ("://") in og_image:
-                    self.icon_link = og_image
-                else:
-                    self.icon_link = (self.parsed_uri.scheme + "://" +
-                                      self.parsed_uri.netloc +
-                                      og_image["content"])
-            else:
-                for iconformat in self.iconformats:
-                    self.icon_link = self.soup.find("link", {"rel": iconformat})
-                    if self.icon_link is not None:
-                        self.icon_link = (self.parsed_uri.scheme + "://" +
-                                          self.parsed_uri.netloc +
-                                          self.icon_link["href"])
-
-            if self.icon_link is None:
-                self.iconrequest = requests.get(
-                    self.parsed_uri.scheme + "://" +
-                    self.parsed_uri.netloc + "/favicon.ico"
-                )
-
-                try:
-                    if self.iconrequest.status_code == 200:
-                        self.icon_link = (
-                            self.parsed_uri.scheme + "://" +
-                            self.parsed_uri.netloc + "/favicon.ico"
-                        )
-                except ConnectionError:
-                    pass
-
-            if self.icon_link is None:
-                self.iconrequest = requests.get(
-                    'https://www.google.com/s2/favicons?domain=' + self.appurl
-                )
-                try:
-                    if self.iconrequest.status_code == 200:
-                        self.icon_link = (
-                            self.parsed_uri.scheme + "://" +
-                            self.parsed_uri.netloc + "/favicon.ico"
-                        )
-                except ConnectionError:
-                    pass
-
-            # Catches ValueError (if the Favicon detector gets an invalid URL)
-            try:
-                self.icondl = urllib.request.urlopen(self.icon_link)
-                self.icon_name = self.icon_link.replace("/", " ").split()[-1]
-                self.icon_ext = self.icon_name.replace(".", " ").split()[-1]
-                with open(_ICON_DIR + "/favicon." + self.icon_ext, "wb") as f:
-                    f.write(self.icondl.read())
-                self.iconpath = _ICON_DIR + "/favicon." + self.icon_ext
-            except ValueError:
-                GLib.idle_add(self.apply_icon, None)
-            else:
-                GLib.idle_add(self.apply_icon, True)
+        self.page = None
 
+        # Catches ValueError (if the Favicon detector gets an invalid URL)
+        try:
+            if self.favicons is None:
+                import favicon
+                self.favicons = favicon.FaviconCache(_FAVICON_DIR)
+            self.favicon_path = self.favicons.get(
+                self.appurl, self.fetch_page,
+                session=self.webclient().session
+            )
+        except ValueError:
+            GLib.idle_add(self.apply_icon, None)
+            return
+
+        if self.favicon_path is not None:
+            self.iconpath = self.favicon_path
+            GLib.idle_add(self.apply_icon, True)
+        elif self.favicons.offline:
+            # nothing cached, and the page was never asked for
+            GLib.idle_add(self.apply_icon, "offline")
         elif self.page is None:
             GLib.idle_add(self.apply_icon, False)
         else:
             GLib.idle_add(self.apply_icon, None)
 
+    def fetch_page(self):
+        self.page = self.errortest(self.appurl)
+        if self.page is None:
+            return None
+        return self.page.head
+
     def apply_icon(self, done):
         if done is True:
             self.new_icon = Pixbuf.new_from_file_at_size(
-                _ICON_DIR + "/favicon." + self.icon_ext, 32, 32
+                self.iconpath, 32, 32
             )
             self.icon.set_from_pixbuf(self.new_icon)
+        elif done == "offline":
+            ErrorDialog(
+                "Favicon Error",
+                "Error: No Cached Favicon",
+                "There is no saved icon for this site, and favicons are\n"
+                "not downloaded while [favicons] offline is set.\n"
+                "The stock icon is used instead.",
+            )
+            self.iconpath = _ICE_ICON
+            self.new_icon = Pixbuf.new_from_file_at_size(_ICE_ICON, 32, 32)
+            self.icon.set_from_pixbuf(self.new_icon)
         elif done is False:
             ErrorDialog(
                 "Address Error",
@@ -655,141 +645,35 @@ class Ice(Gtk.Window):
     def applicate(self):
         self.title = self.name.get_text()
         self.address = self.normalize(self.url.get_text())
-
-        self.semiformatted = ""
-        self.array = filter(str.isalpha, self.title)
-        for obj in self.array:
-            self.semiformatted = self.semiformatted + obj
-        self.formatted = self.semiformatted.lower()
+        self.formatted = ssb.formatted_name(self.title)
 
         self.loc = self.where.get_active_text()
-        if self.loc == _("Accessories"):
-            self.location = "Utility;"
-        elif self.loc == _("Games"):
-            self.location = "Game;"
-        elif self.loc == _("Graphics"):
-            self.location = "Graphics;"
-        elif self.loc == _("Internet"):
-            self.location = "Network;"
-        elif self.loc == _("Office"):
-            self.location = "Office;"
-        elif self.loc == _("Programming"):
-            self.location = "Development;"
-        elif self.loc == _("Multimedia"):
-            self.location = "AudioVideo;"
-        elif self.loc == _("System"):
-            self.location = "System;"
+        for self.label, self.value in ssb.CATEGORIES:
+            if self.loc == _(self.label):
+                self.location = self.value
 
         self.iconname = self.iconpath.replace("/", " ").split()[-1]
         self.iconext = self.iconname.replace(".", " ").split()[-1]
 
-        if os.path.exists("{0}/{1}.desktop".format(_APPS_DIR, self.formatted)):
-            GLib.idle_add(self.applicate_error, "Duplicate")
-        elif len(self.title) == 0:
-            GLib.idle_add(self.applicate_error, "Name")
+        try:
+            ssb.check(self.title)
+        except ssb.SSBError as e:
+            GLib.idle_add(self.applicate_error, e.kind)
         else:
             self.writefile(self.title, self.formatted, self.address,
                            self.iconext, self.location)
 
     def writefile(self, title, formatted, address, iconext, location):
-        shutil.copyfile(self.iconpath,
-                        "{0}/{1}.{2}".format(_ICON_DIR, formatted, iconext))
-        self.appfile = os.path.expanduser("{0}/{1}.desktop".format(_APPS_DIR,
-                                                                   formatted))
-        if self.chrome.get_active() is True:
-            self.browser = "google-chrome"
-        elif self.chromium.get_active() is True:
-            self.browser = "chromium-browser"
-        elif self.brave.get_active() is True:
-            self.browser = "brave"
-        elif self.vivaldi.get_active() is True:
-            self.browser = "vivaldi"
-        elif self.firefox.get_active() is True:
-            self.browser = "firefox"
-        elif self.epiphany.get_active() is True:
-            self.browser = "epiphany"
+        for self.browser, radio in self.radios.items():
+            if radio.get_active() is True:
+                break
         else:
             print(_("ERROR: An unknown browser selection error has occurred."))
             sys.exit(1)
 
-        with open(self.appfile, 'w') as self.appfile1:
-            self.appfile1.truncate()
-
-            self.appfile1.write("[Desktop Entry]\n")
-            self.appfile1.write("Version=1.0\n")
-            self.appfile1.write("Name={0}\n".format(title))
-            self.appfile1.write("Comment={0} (Ice SSB)\n".format(title))
-
-            if self.browser == "firefox":
-                self.firefox_profile_path = "{0}/{1}".format(_FF_PROFILES_DIR,
-                                                             formatted)
-                self.appfile1.write("Exec=" + self.browser +
-                                    " --class ICE-SSB-" + formatted +
-                                    " --profile " + self.firefox_profile_path +
-                                    " --no-remote " + address + "\n")
-
-                self.appfile1.write("IceFirefox={0}\n".format(formatted))
-                self.init_firefox_profile(self.firefox_profile_path)
-            elif self.browser == "epiphany":
-                self.epiphany_profile_path = "{0}/{1}".format(
-                    _EPIPHANY_PROFILES_DIR, "epiphany-" + formatted
-                )
-                self.appfile1.write(
-                    "Exec={0} --application-mode --profile=\""
-                    "{2}\" {1}\n".format(
-                        self.browser, address, self.epiphany_profile_path
-                    )
-                )
-                self.appfile1.write("IceEpiphany={0}\n".format(formatted))
-            else:
-                if self.isolate_profile is True:
-                    self.profile_path = "{0}/{1}".format(_PROFILES_DIR,
-                                                         formatted)
-                    self.appfile1.write("Exec=" + self.browser +
-                                        " --app=" + address +
-                                        " --class=ICE-SSB-" + formatted +
-                                        " --user-data-dir=" +
-                                        self.profile_path + "\n")
-
-                    self.appfile1.write("X-ICE-SSB-Profile=" +
-                                        formatted + "\n")
-                else:
-                    self.appfile1.write("Exec=" + self.browser +
-                                        " --app=" + address +
-                                        " --class=ICE-SSB-" + formatted +
-                                        "\n")
-
-            self.appfile1.write("Terminal=false\n")
-            self.appfile1.write("X-MultipleArgs=false\n")
-            self.appfile1.write("Type=Application\n")
-            if self.browser == "epiphany":
-                self.appfile1.write("Icon={0}/app-icon.{2}\n".format(
-                    self.epiphany_profile_path,
-                    formatted,
-                    iconext
-                ))
-            else:
-                self.appfile1.write("Icon={0}/{1}.{2}\n".format(
-                    _ICON_DIR,
-                    formatted,
-                    iconext
-                ))
-
-            self.appfile1.write("Categories=GTK;{0}\n".format(location))
-            self.appfile1.write("MimeType=text/html;text/xml;"
-                                "application/xhtml_xml;\n")
-
-            self.appfile1.write(
-                "StartupWMClass=ICE-SSB-{0}\n".format(formatted)
-            )
-            self.appfile1.write("StartupNotify=true\n")
-
-            if self.browser == "epiphany":
-                self.init_epiphany_profile(
-                    self.epiphany_profile_path,
-                    formatted, iconext, self.appfile
-                )
-
+        self.appfile = ssb.writefile(title, formatted, address, self.iconpath,
+                                     iconext, location, self.browser,
+                                     self.isolate_profile)
         GLib.idle_add(self.ice_update)
 
     def ice_update(self):
@@ -800,98 +684,78 @@ class Ice(Gtk.Window):
         self.icon.set_from_pixbuf(self.new_icon)
         self.details = self.get_details(self.appfile)
         if self.details is not None:
-            self.liststore.prepend([self.details['pixbuf'],
-                                    self.details['nameline']])
+            # the watcher may have added it already
+            self.show_app(self.details, prepend=True)
 
     def init_firefox_profile(self, path):
-        self.chromepath = "{0}/chrome".format(path)
-        self.settingsfile = "{0}/user.js".format(path)
-        self.cssfile = "{0}/userChrome.css".format(self.chromepath)
+        ssb.init_firefox_profile(path)
 
-        os.makedirs(self.chromepath)
+    def selection_changed(self, iconview):
+        self.delete_button.set_sensitive(
+            len(iconview.get_selected_items()) > 0
+        )
 
+    def delete(self, widget, *args):
+        # The rows and catalog entries go at once; the files, which can
+        # be hundreds of MB per profile, go on the delete pool.
+        treeiters = [self.liststore.get_iter(path)
+                     for path in self.iconview.get_selected_items()]
+        appfiles = [self.liststore.get_value(treeiter, 2)
+                    for treeiter in treeiters]
+        if not appfiles:
+            return
+        for treeiter in treeiters:
+            self.liststore.remove(treeiter)
+        self.deleting.update(appfiles)
+        for appfile in appfiles:
+            self.catalog.forget(appfile)
+
+        if self.delete_pool is None:
+            self.delete_pool = concurrent.futures.ThreadPoolExecutor(4)
+        if self.delete_total == 0:
+            # one menu refresh once everything queued is gone
+            desktopdb.refresher(_APPS_DIR).hold()
+        self.delete_total += len(appfiles)
+        self.show_delete_progress()
+        for appfile in appfiles:
+            self.delete_pool.submit(self.delete_app, appfile)
+
+    def delete_app(self, appfile):
+        # Delete pool thread: one rename moves the profile out of the
+        # way, then it is deleted from the trash
         try:
-            shutil.copyfile('/usr/lib/peppermint/ice/search.json.mozlz4',
-                            path + '/search.json.mozlz4')
-        except FileNotFoundError:
-            print("Error: search.json.mozlz4 not found")
+            trashed = ssb.discard(appfile)
+        except OSError:
+            trashed = []
+        for path in trashed:
+            ssb.purge(path)
+        GLib.idle_add(self.app_deleted, appfile)
+
+    def app_deleted(self, appfile):
+        self.deleting.discard(appfile)
+        self.delete_done += 1
+        if self.delete_done == self.delete_total:
+            self.delete_done = 0
+            self.delete_total = 0
+            menu = desktopdb.refresher(_APPS_DIR)
+            if menu.release():
+                # refreshes on the timer thread, not the main loop
+                menu.changed()
+        self.show_delete_progress()
+        return False
 
-        try:
-            shutil.copyfile('/usr/lib/peppermint/ice/places.sqlite',
-                            path + '/places.sqlite')
-        except FileNotFoundError:
-            print("Error: places.sqlite not found")
-
-        with open(self.cssfile, 'w') as cfile:
-            cfile.write("#nav-bar, #identity-box, #tabbrowser-tabs, "
-                        "#TabsToolbar { visibility: collapse !important; }")
-
-        with open(self.settingsfile, 'w') as sfile:
-            sfile.write('user_pref("browser.cache.disk.enable",'
-                        ' false);')
-            sfile.write('user_pref("browser.cache.disk.capacity", 0);')
-            sfile.write('user_pref("browser.cache.disk.filesystem_reported"'
-                        ', 1);')
-            sfile.write('user_pref("browser.cache.disk.smart_size.enabled",'
-                        ' false);')
-            sfile.write('user_pref("browser.cache.disk.smart_size.first_run",'
-                        ' false);')
-            sfile.write('user_pref("browser.cache.disk.smart_size.use_old_max"'
-                        ', false);')
-            sfile.write('user_pref("browser.ctrlTab.previews", true);')
-            sfile.write('user_pref("browser.tabs.drawInTitlebar", false);')
-            sfile.write('user_pref("browser.tabs.warnOnClose", false);')
-            sfile.write('user_pref("browser.toolbars.bookmarks.visibility"'
-                        ', false);')
-            sfile.write('user_pref("plugin.state.flash", 2);')
-            sfile.write('user_pref("toolkit.legacyUserProfileCustomizations.'
-                        'stylesheets", true);')
-
-    def init_epiphany_profile(self, path, formatted, iconext, appfile):
-        os.makedirs(path)
-        shutil.copyfile("{0}/{1}.{2}".format(_ICON_DIR, formatted, iconext),
-                        "{0}/app-icon.{1}".format(path, iconext))
-        # subprocess.run(["touch", path + "/.app"])
-        os.replace(appfile, "{0}/epiphany-{1}.desktop".format(path, formatted))
-        os.symlink("{0}/epiphany-{1}.desktop".format(path, formatted), appfile)
-
-    def delete(self, button, item):
-        self.a = self.iconview.get_selected_items()
-        self.b = self.liststore.get_iter(self.a[0])
-        self.c = self.liststore.get_value(self.b, 1)
-        self.liststore.remove(self.b)
-
-        self.semiformatted = ""
-        self.array = filter(str.isalpha, self.c)
-
-        for obj in self.array:
-            self.semiformatted = self.semiformatted + obj
-
-        self.formatted = self.semiformatted.lower()
-        self.appfile = "{0}/{1}.desktop".format(_APPS_DIR, self.formatted)
-
-        self.appfileopen = open(self.appfile, 'r')
-        self.appfilelines = self.appfileopen.readlines()
-        self.appfileopen.close()
-
-        for line in self.appfilelines:
-            if "IceFirefox=" in line:
-                self.profile = line.replace('IceFirefox=', '')
-                self.profile = self.profile.rstrip('\n')
-                shutil.rmtree("{0}/{1}".format(_FF_PROFILES_DIR, self.profile))
-
-            if "IceEpiphany=" in line:
-                self.profile = str.replace(line, 'IceEpiphany=', '')
-                self.profile = str.replace(self.profile, "\n", '')
-                shutil.rmtree("{0}/epiphany-{1}".format(_EPIPHANY_PROFILES_DIR,
-                                                        self.profile))
-
-            if "X-ICE-SSB-Profile=" in line:
-                self.profile = line.replace('X-ICE-SSB-Profile=', '')
-                self.profile = self.profile.rstrip('\n')
-                shutil.rmtree("{0}/{1}".format(_PROFILES_DIR, self.profile))
-
-        os.remove(self.appfile)
+    def show_delete_progress(self):
+        if self.delete_total == 0:
+            self.delete_progress.hide()
+            return
+        self.delete_progress.set_fraction(self.delete_done /
+                                          self.delete_total)
+        self.delete_progress.set_text(_("Removed {0} of {1}").format(
+            self.delete_done, self.delete_total))
+        self.delete_progress.show()
+
+    def profile_dir(self, details):
+        return ssb.profile_dir(details)
 
     def applicate_error(self, error):
         if error == "Duplicate":
@@ -909,34 +773,47 @@ class Ice(Gtk.Window):
             )
 
     def clean_orphaned_profiles(self, known_apps):
-        self.known_profiles = []
+        # Runs on a worker thread once the window is up
         for app in known_apps:
-            self.a = "{0}/{1}".format(_FF_PROFILES_DIR, app['profile'])
-            if app['profile'] != "":
-                # make sure firefox apps have profiles available
-                if app['is_firefox'] is True and not os.path.isdir(self.a):
-                    self.init_firefox_profile(self.a)
-                self.known_profiles.append(app['profile'])
-
-        for p_type in ['profiles', 'firefox']:
-            for fl in os.listdir("{0}/{1}/".format(_ICE_DIR, p_type)):
-                self.a = "{0}/{1}/{2}".format(_ICE_DIR, p_type, fl)
-                if not os.path.isdir(self.a) or fl not in self.known_profiles:
-                    shutil.rmtree(self.a)
+            # make sure firefox apps have profiles available
+            if app.isolation == desktopentry.FIREFOX:
+                path = self.profile_dir(app)
+                if not os.path.isdir(path):
+                    self.init_firefox_profile(path)
+
+        orphans.clean(orphans.find(orphans.known(known_apps)))
 
     def browser_button(self, button):
-        if button.get_label() == "Firefox":
-            self.isolate_button.set_label(_("Firefox is always Isolated"))
-            self.isolate_button.set_sensitive(False)
-        elif button.get_label() == "GNOME Web":
-            self.isolate_button.set_label(_("GNOME Web is always Isolated"))
+        for key, radio in self.radios.items():
+            if radio is button:
+                self.set_isolate_button(key)
+
+    def set_isolate_button(self, key):
+        browser = browsers.BY_KEY[key]
+        if browser.always_isolated():
+            self.isolate_button.set_label(
+                _("{0} is always isolated").format(browser.label)
+            )
             self.isolate_button.set_sensitive(False)
         else:
             self.isolate_button.set_label(_("Isolate the SSB"))
             self.isolate_button.set_sensitive(True)
 
 
+def startup_probe(widget, event):
+    # Used by bench/bench_startup.py: report when the window is mapped
+    # (CLOCK_MONOTONIC, comparable across processes) and quit.
+    print("ICE_STARTUP_MAPPED {0:.6f}".format(time.monotonic()), flush=True)
+    GLib.idle_add(Gtk.main_quit)
+    return False
+
+
 if __name__ == '__main__':
     window = Ice()
     window.connect("delete-event", Gtk.main_quit)
+    if os.getenv("ICE_STARTUP_PROBE"):
+        window.connect("map-event", startup_probe)
     Gtk.main()
+    if config.getboolean("http", "stats") and "webclient" in sys.modules:
+        print("HTTP requests: {requests}, reused page fetches: "
+              "{reused}".format(**window.webclient().stats()))
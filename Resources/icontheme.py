@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+#
+# Installs SSB icons into the user's hicolor icon theme at every size.
+#
+# An SSB icon used to be a single copy of whatever the user picked or the
+# site served (.ico, .svg, a 1200px og:image) that the desktop and Ice
+# rescaled each time it was drawn. Here the source is decoded once and
+# written out as <size>x<size>/apps/ice-ssb-<name>.png for each of SIZES
+# under ~/.local/share/icons/hicolor, so the .desktop file can name the
+# icon and everything loads a file of the right size. Bitmaps are not
+# scaled up past their own size (the theme lookup picks the nearest
+# size); SVGs are rendered at every size.
+#
+# A manifest keyed by the source's path, mtime and size lets render()
+# skip icons whose source has not changed. batch() renders many icons
+# on a process pool.
+#
+#   icontheme.py        (re-)render the icons of all SSBs that need it
+
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+
+HOME = os.getenv("HOME")
+THEME_DIR = "{0}/.local/share/icons/hicolor".format(HOME)
+MANIFEST = "{0}/.ice-icons.json".format(THEME_DIR)
+SIZES = [16, 24, 32, 48, 64, 128, 256]
+PREFIX = "ice-ssb-"
+
+_lock = threading.Lock()
+
+
+def icon_name(formatted):
+    return PREFIX + formatted
+
+
+def icon_file(name, size):
+    return "{0}/{1}x{1}/apps/{2}.png".format(THEME_DIR, size, name)
+
+
+def lookup(name, size):
+    # Path of the installed icon nearest to size, or None
+    for candidate in sorted(SIZES, key=lambda s: (s < size, abs(s - size))):
+        path = icon_file(name, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def source_key(source):
+    st = os.stat(source)
+    return [os.path.realpath(source), st.st_mtime_ns, st.st_size]
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(update):
+    # update: {name: source key, or None to forget the name}
+    with _lock:
+        manifest = load_manifest()
+        for name, key in update.items():
+            if key is None:
+                manifest.pop(name, None)
+            else:
+                manifest[name] = key
+        os.makedirs(THEME_DIR, exist_ok=True)
+        tmp = "{0}.{1}.tmp".format(MANIFEST, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, MANIFEST)
+
+
+def draw(source, name):
+    # Writes the PNGs for one icon and returns the sizes written. Runs in
+    # a worker process for batch(), so GdkPixbuf is imported here.
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf, GLib
+
+    Pixbuf = GdkPixbuf.Pixbuf
+    vector = source.lower().endswith((".svg", ".svgz"))
+    original = None if vector else Pixbuf.new_from_file(source)
+    largest = None if vector else max(original.get_width(),
+                                      original.get_height())
+
+    written = []
+    for size in SIZES:
+        path = icon_file(name, size)
+        if not vector and size > largest and size != SIZES[0]:
+            # nothing to gain from scaling up; drop one left from an
+            # earlier, bigger source
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+
+        if vector:
+            scaled = Pixbuf.new_from_file_at_scale(source, size, size, True)
+        else:
+            factor = size / largest
+            scaled = original.scale_simple(
+                max(1, round(original.get_width() * factor)),
+                max(1, round(original.get_height() * factor)),
+                GdkPixbuf.InterpType.HYPER
+            )
+        if scaled.get_width() != size or scaled.get_height() != size:
+            # centre non-square images on a transparent square
+            square = Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, size, size)
+            square.fill(0)
+            if not scaled.get_has_alpha():
+                scaled = scaled.add_alpha(False, 0, 0, 0)
+            scaled.copy_area(0, 0, scaled.get_width(), scaled.get_height(),
+                             square, (size - scaled.get_width()) // 2,
+                             (size - scaled.get_height()) // 2)
+            scaled = square
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            scaled.savev(tmp, "png", [], [])
+            os.replace(tmp, path)
+        except (GLib.Error, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        written.append(size)
+    return written
+
+
+def up_to_date(source, name, manifest=None):
+    if manifest is None:
+        manifest = load_manifest()
+    try:
+        return manifest.get(name) == source_key(source) and \
+            lookup(name, SIZES[0]) is not None
+    except OSError:
+        return False
+
+
+def render(source, name):
+    # Installs source as icon name unless it already is; returns True if
+    # the icon is in the theme afterwards
+    if up_to_date(source, name):
+        return True
+    try:
+        draw(source, name)
+    except Exception:
+        # no GdkPixbuf, or a file it cannot decode
+        return False
+    save_manifest({name: source_key(source)})
+    return True
+
+
+def batch(jobs, workers=None):
+    # jobs: [(source, name)]; renders the ones that changed on a process
+    # pool and returns {name: True/False}
+    manifest = load_manifest()
+    results = {}
+    todo = []
+    for source, name in jobs:
+        if up_to_date(source, name, manifest):
+            results[name] = True
+        else:
+            todo.append((source, name))
+
+    done = {}
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(draw, source, name): (source, name)
+                   for source, name in todo}
+        for future in concurrent.futures.as_completed(futures):
+            source, name = futures[future]
+            try:
+                future.result()
+            except Exception:
+                results[name] = False
+                continue
+            results[name] = True
+            done[name] = source_key(source)
+    if done:
+        save_manifest(done)
+    return results
+
+
+def remove(name):
+    for size in SIZES:
+        try:
+            os.remove(icon_file(name, size))
+        except FileNotFoundError:
+            pass
+    save_manifest({name: None})
+
+
+if __name__ == '__main__':
+    import catalog
+    import desktopdb
+    import ssb
+
+    # SSBs made before icons went into the theme still name a file in
+    # ICON_DIR; render those too and switch them over
+    apps = catalog.Catalog(ssb.CATALOG_DB, ssb.APPS_DIR).refresh()
+    jobs = []
+    switch = {}
+    for app in apps:
+        formatted = os.path.splitext(os.path.basename(app.path))[0]
+        if app.icon.startswith(PREFIX) or \
+                app.icon.startswith(ssb.ICON_DIR + "/"):
+            source = ssb.icon_source(formatted)
+            if source is not None:
+                jobs.append((source, icon_name(formatted)))
+                if app.icon != icon_name(formatted):
+                    switch[icon_name(formatted)] = app.path
+
+    results = batch(jobs)
+    with desktopdb.refresher(ssb.APPS_DIR).batch():
+        for name, appfile in switch.items():
+            if results.get(name):
+                ssb.use_theme_icon(appfile, name)
+    print("{0} icons up to date, {1} failed".format(
+        sum(results.values()), len(results) - sum(results.values())))
+    sys.exit(0)
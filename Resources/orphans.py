@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+#
+# Finds and removes browser profiles that no SSB uses any more.
+#
+# Isolated Chromium profiles (~/.local/share/ice/profiles) and Firefox
+# profiles (~/.local/share/ice/firefox) are kept per SSB and left behind
+# when the .desktop file is removed by hand. Orphans are first renamed
+# into the trash directory, which is instant, and deleted afterwards.
+# Profiles made in the last few minutes are left alone (writefile makes
+# a Firefox profile before its .desktop file), and each one is checked
+# against the applications directory again right before it is moved.
+#
+#   orphans.py --dry-run     list orphans and the bytes they would free
+#   orphans.py               remove them
+
+import argparse
+import os
+import sys
+import time
+
+import catalog
+import ssb
+
+_PROFILE_DIRS = [ssb.PROFILES_DIR, ssb.FF_PROFILES_DIR]
+# seconds a new profile is given to get its .desktop file
+_MIN_AGE = 600
+
+
+def known(apps):
+    # Profile names in use by apps (DesktopEntry objects)
+    return {app.profile for app in apps if app.profile != ""}
+
+
+def find(profiles, min_age=_MIN_AGE):
+    # Paths in the profile directories whose name is not in profiles
+    now = time.time()
+    for directory in _PROFILE_DIRS:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and \
+                    entry.name in profiles:
+                continue
+            try:
+                if now - entry.stat(follow_symlinks=False).st_mtime < min_age:
+                    continue
+            except OSError:
+                continue
+            yield entry.path
+
+
+def size(path):
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except NotADirectoryError:
+            return os.lstat(path).st_blocks * 512
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_blocks * 512
+            except OSError:
+                continue
+    return total
+
+
+def clean(paths):
+    # Returns the paths that were moved to the trash. paths may come from
+    # an older look at the SSBs, so what is in use is read again.
+    in_use = known(catalog.Catalog(ssb.CATALOG_DB, ssb.APPS_DIR).refresh())
+    moved = []
+    for path in paths:
+        if os.path.basename(path) in in_use:
+            continue
+        try:
+            ssb.trash(path)
+        except OSError:
+            continue
+        moved.append(path)
+    ssb.empty_trash()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove browser profiles no Ice SSB uses any more"
+    )
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="only list orphans and the space they use")
+    args = parser.parse_args()
+
+    apps = catalog.Catalog(ssb.CATALOG_DB, ssb.APPS_DIR).refresh()
+    orphans = list(find(known(apps)))
+    total = 0
+    for path in orphans:
+        n = size(path)
+        total += n
+        print("{0:>10}  {1}".format(ssb.human_size(n), path))
+
+    if args.dry_run:
+        print("{0} orphaned profiles, {1} would be reclaimed".format(
+            len(orphans), ssb.human_size(total)))
+        return 0
+
+    removed = clean(orphans)
+    print("{0} orphaned profiles removed, {1} reclaimed".format(
+        len(removed), ssb.human_size(total)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+#
+# Optional user daemon that keeps the SSBs you use warm.
+#
+# It watches /proc for Ice SSB browsers (--class ICE-SSB-<name>) and keeps
+# a count of how often, and how soon after login, each SSB is started.
+# At start, and every [prefetch] refresh seconds after that, the browser
+# binary and the profile databases of the SSBs most likely to be started
+# next are handed to the kernel with posix_fadvise(WILLNEED) so a cold
+# start reads them from the page cache instead of the disk. At most
+# [prefetch] budget bytes are prefetched per round.
+#
+# Every launch it sees is logged to ~/.local/share/ice/prefetch.log with
+# its time-to-window (from the browser process start until a window of
+# its class is mapped, via wmctrl if installed) and whether it had been
+# prefetched, so the effect can be compared.
+#
+#   prefetch.py            run the daemon (from autostart or a user unit)
+#   prefetch.py --once     prefetch once and exit
+#   prefetch.py --stats    show what has been learnt
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import catalog
+import config
+import ssb
+
+STATE_FILE = "{0}/prefetch.json".format(ssb.ICE_DIR)
+LOG_FILE = "{0}/prefetch.log".format(ssb.ICE_DIR)
+
+# started this long after the daemon counts as started at login
+_LOGIN_WINDOW = 180
+
+_CLASS = re.compile(r"ICE-SSB-(\S+)")
+# --class=ICE-SSB-<name> (Chromium) or --class ICE-SSB-<name> (Firefox)
+_CLASS_ARG = re.compile(r"^(?:--class=)?ICE-SSB-(\S+)$")
+# child processes of the browsers, not launches
+_CHILD_ARGS = ("--type=", "-contentproc")
+
+_SQLITE_MAGIC = b"SQLite format 3\0"
+_BINARY_SUFFIXES = (".so", ".pak", ".dat", ".bin")
+
+_HZ = os.sysconf("SC_CLK_TCK")
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    tmp = "{0}.{1}.tmp".format(STATE_FILE, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, STATE_FILE)
+    except OSError:
+        pass
+
+
+def log(line):
+    try:
+        with open(LOG_FILE, "a") as f:
+            f.write("{0} {1}\n".format(time.strftime("%Y-%m-%d %H:%M:%S"),
+                                       line))
+    except OSError:
+        pass
+
+
+def running():
+    # {ssb name: (pid, seconds since the process started)}
+    with open("/proc/uptime") as f:
+        uptime = float(f.read().split()[0])
+    found = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open("/proc/{0}/cmdline".format(pid), "rb") as f:
+                args = f.read().decode("utf-8", "ignore").split("\0")
+            matches = [m for m in map(_CLASS_ARG.match, args) if m]
+            if not matches or \
+                    any(arg.startswith(_CHILD_ARGS) for arg in args):
+                continue
+            with open("/proc/{0}/stat".format(pid)) as f:
+                # the command name (field 2) may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        age = uptime - int(fields[19]) / _HZ
+        name = matches[0].group(1)
+        if name not in found or found[name][1] < age:
+            found[name] = (int(pid), age)
+    return found
+
+
+def window_classes():
+    # WM_CLASS of every mapped window, or None without wmctrl
+    try:
+        out = subprocess.run(["wmctrl", "-lx"], capture_output=True,
+                             text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    classes = set()
+    for line in out.splitlines():
+        fields = line.split(None, 3)
+        if len(fields) >= 3:
+            classes.update(fields[2].split("."))
+    return classes
+
+
+def time_to_window(name, age, warm, timeout=60):
+    # Runs on its own thread for each launch
+    wmclass = "ICE-SSB-" + name
+    start = time.monotonic() - age
+    classes = window_classes()
+    if classes is None:
+        log("launch {0} prefetched={1} time-to-window=unknown "
+            "(wmctrl not found)".format(name, warm))
+        return
+    if wmclass in classes:
+        # mapped before the launch was noticed; nothing to measure
+        return
+    while time.monotonic() - start < timeout:
+        time.sleep(0.05)
+        classes = window_classes() or set()
+        if wmclass in classes:
+            log("launch {0} prefetched={1} time-to-window={2:.0f} ms".format(
+                name, warm, (time.monotonic() - start) * 1000))
+            return
+    log("launch {0} prefetched={1} no window after {2} s".format(
+        name, warm, timeout))
+
+
+def apps_by_name():
+    # SSB name (the part after ICE-SSB-) -> DesktopEntry
+    apps = {}
+    for app in catalog.Catalog(ssb.CATALOG_DB, ssb.APPS_DIR).refresh():
+        match = _CLASS.search(app.exec_line)
+        if match:
+            apps[match.group(1)] = app
+    return apps
+
+
+def binary_files(command):
+    path = shutil.which(command)
+    if path is None:
+        return []
+    # wrapper scripts (chromium-browser, google-chrome) exec a real
+    # binary that lives next to its libraries and .pak files
+    real = os.path.realpath(path)
+    files = [real]
+    directory = os.path.dirname(real)
+    if directory not in ("/usr/bin", "/bin", "/usr/local/bin"):
+        try:
+            for entry in os.scandir(directory):
+                if entry.is_file() and (entry.name.endswith(_BINARY_SUFFIXES)
+                                        or os.access(entry.path, os.X_OK)):
+                    files.append(entry.path)
+        except OSError:
+            pass
+    return files
+
+
+def profile_files(path, depth=2):
+    # SQLite databases in the top levels of a profile
+    files = []
+    stack = [(path, 0)]
+    while stack:
+        directory, level = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if level < depth:
+                        stack.append((entry.path, level + 1))
+                elif entry.is_file(follow_symlinks=False):
+                    with open(entry.path, "rb") as f:
+                        if f.read(16) == _SQLITE_MAGIC:
+                            files.append(entry.path)
+            except OSError:
+                continue
+    return files
+
+
+def willneed(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return 0
+    try:
+        size = os.fstat(fd).st_size
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        size = 0
+    finally:
+        os.close(fd)
+    return size
+
+
+def score(record, now):
+    # launches at login count double; older launches fade over a week
+    recency = max(0.0, 1 - (now - record.get("last", 0)) / (7 * 86400))
+    return record.get("launches", 0) + record.get("login", 0) + 5 * recency
+
+
+def prefetch(state, budget, skip=()):
+    # Returns the SSB names prefetched
+    apps = apps_by_name()
+    now = time.time()
+    ranked = sorted((name for name in state if name in apps
+                     and name not in skip),
+                    key=lambda name: score(state[name], now), reverse=True)
+    used = 0
+    done = set()
+    warmed = []
+    for name in ranked:
+        app = apps[name]
+        files = binary_files(app.browser)
+        profile = ssb.profile_dir(app)
+        if profile is not None:
+            files += profile_files(profile)
+        for path in files:
+            if path in done:
+                continue
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+            if used + size > budget:
+                return warmed
+            used += willneed(path)
+            done.add(path)
+        warmed.append(name)
+    return warmed
+
+
+def daemon(interval, refresh, budget):
+    state = load_state()
+    started = time.monotonic()
+    now = running()
+    warm = set(prefetch(state, budget, skip=now))
+    # SSBs started just before the daemon (both from autostart) are
+    # launches too
+    seen = {name: value for name, value in now.items()
+            if value[1] > _LOGIN_WINDOW}
+    last_prefetch = time.monotonic()
+    log("prefetched {0}".format(", ".join(sorted(warm)) or "nothing"))
+
+    while True:
+        time.sleep(interval)
+        now = running()
+        for name, (pid, age) in now.items():
+            if name in seen:
+                continue
+            record = state.setdefault(name, {"launches": 0, "login": 0})
+            record["launches"] += 1
+            record["last"] = time.time()
+            if time.monotonic() - started < _LOGIN_WINDOW:
+                record["login"] += 1
+            save_state(state)
+            thread = threading.Thread(target=time_to_window,
+                                      args=(name, age, name in warm))
+            thread.daemon = True
+            thread.start()
+        seen = now
+
+        if time.monotonic() - last_prefetch > refresh:
+            warm = set(prefetch(state, budget, skip=seen))
+            last_prefetch = time.monotonic()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep the browser files of often used Ice SSBs warm"
+    )
+    parser.add_argument("--once", action="store_true",
+                        help="prefetch once and exit")
+    parser.add_argument("--stats", action="store_true",
+                        help="show launch counts and exit")
+    args = parser.parse_args()
+    budget = config.getint("prefetch", "budget")
+
+    if args.stats:
+        state = load_state()
+        now = time.time()
+        for name in sorted(state, key=lambda n: score(state[n], now),
+                           reverse=True):
+            print("{0:>6} launches {1:>4} at login  {2}".format(
+                state[name].get("launches", 0), state[name].get("login", 0),
+                name))
+        return 0
+
+    if args.once:
+        warm = prefetch(load_state(), budget, skip=running())
+        print("prefetched {0}".format(", ".join(warm) or "nothing"))
+        return 0
+
+    try:
+        daemon(config.getfloat("prefetch", "interval"),
+               config.getfloat("prefetch", "refresh"), budget)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+#
+# Pre-built Firefox profile template for new SSB profiles.
+#
+# A new Firefox SSB used to copy search.json.mozlz4 and places.sqlite and
+# write userChrome.css and user.js from scratch. Instead the files are
+# laid out once in a template directory named after a hash of their
+# content (so a change to the prefs or CSS gives a new template), and new
+# profiles are cloned from it: reflinks where the filesystem supports
+# them, otherwise hardlinks, otherwise plain copies. Files Firefox
+# rewrites in place (places.sqlite) are never hardlinked, as that would
+# share the writes between profiles.
+#
+# Older versions of a template are removed by the next build(), but only
+# while no clone holds the templates directory's lock (shared by clone(),
+# exclusive for the removal) and once build() has not handed a version
+# out for _GRACE seconds, so another Ice still on the old prefs is not
+# cloning from a directory that goes away.
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+
+# linux/fs.h: _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
+# Firefox updates these in place; they must get their own blocks
+_MUTABLE = frozenset(["places.sqlite"])
+
+_NO_REFLINK = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+               errno.ENOSYS, errno.EPERM)
+
+# seconds an old template version is kept after it was last handed out
+_GRACE = 600
+
+_lock = threading.Lock()
+_reflink = {}
+_templates = {}
+_listings = {}
+# seed files already reported missing
+_missing = set()
+
+
+def firefox_files(source_dir, css, prefs):
+    # relative path -> bytes, or -> source path for files copied as is
+    files = {
+        "chrome/userChrome.css": css.encode(),
+        "user.js": "".join(prefs).encode(),
+    }
+    for name in ["search.json.mozlz4", "places.sqlite"]:
+        path = "{0}/{1}".format(source_dir, name)
+        if os.path.isfile(path):
+            files[name] = path
+        elif path not in _missing:
+            _missing.add(path)
+            sys.stderr.write("profiletemplate: {0} not found, new Firefox "
+                             "profiles are made without it\n".format(path))
+    return files
+
+
+def digest(files):
+    h = hashlib.sha256()
+    for name in sorted(files):
+        h.update(name.encode() + b"\0")
+        content = files[name]
+        if isinstance(content, bytes):
+            h.update(content)
+        else:
+            with open(content, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def stamp(files):
+    # Cheap key for files, so the hash is only computed once per process
+    # (or after a source file changes).
+    key = []
+    for name in sorted(files):
+        content = files[name]
+        if isinstance(content, bytes):
+            key.append((name, content))
+        else:
+            st = os.stat(content)
+            key.append((name, content, st.st_mtime_ns, st.st_size))
+    return tuple(key)
+
+
+def build(templates_dir, kind, files):
+    # Returns the template directory for files, creating it if needed.
+    key = (templates_dir, kind, stamp(files))
+    with _lock:
+        path = _templates.get(key)
+        if path is not None and os.path.isdir(path):
+            return handed_out(path)
+
+        version = digest(files)
+        path = "{0}/{1}-{2}".format(templates_dir, kind, version)
+        if os.path.isdir(path):
+            _templates[key] = path
+            return handed_out(path)
+
+        tmp = "{0}.{1}.{2}.tmp".format(path, os.getpid(),
+                                       threading.get_ident())
+        os.makedirs(templates_dir, exist_ok=True)
+        for name, content in files.items():
+            target = "{0}/{1}".format(tmp, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if isinstance(content, bytes):
+                with open(target, "wb") as f:
+                    f.write(content)
+            else:
+                shutil.copyfile(content, target)
+            # the template itself is never written to again
+            os.chmod(target, 0o444)
+
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another process built the same version first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        # profiles cloned from older versions keep their own links to
+        # the data
+        prune(templates_dir, kind, path)
+
+        _templates[key] = path
+        return handed_out(path)
+
+
+def handed_out(path):
+    # the mtime tells prune() when a version was last used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+def lockfile(templates_dir):
+    return open("{0}/.lock".format(templates_dir), "a")
+
+
+def prune(templates_dir, kind, keep):
+    # Removes the other versions of a template that nobody can be
+    # cloning from; left for a later build() while a clone runs
+    with lockfile(templates_dir) as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        prefix = kind + "-"
+        now = time.time()
+        for entry in os.scandir(templates_dir):
+            if not entry.name.startswith(prefix) or entry.path == keep or \
+                    entry.name.endswith(".tmp"):
+                continue
+            try:
+                if now - entry.stat().st_mtime < _GRACE:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def reflink(src, dst, dev):
+    if _reflink.get(dev) is False:
+        return False
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        except OSError as e:
+            if e.errno not in _NO_REFLINK:
+                raise
+            _reflink[dev] = False
+            ok = False
+        else:
+            _reflink[dev] = True
+            ok = True
+    if not ok:
+        os.remove(dst)
+    return ok
+
+
+def clone_file(src, dst, name, dev):
+    if reflink(src, dst, dev):
+        os.chmod(dst, 0o644)
+        return "reflink"
+    if name not in _MUTABLE:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    os.chmod(dst, 0o644)
+    return "copy"
+
+
+def listing(template):
+    # (directories, files) relative to template, read once per process;
+    # a template directory never changes once built
+    found = _listings.get(template)
+    if found is None:
+        dirs = []
+        files = []
+        for root, dirnames, filenames in os.walk(template):
+            rel = os.path.relpath(root, template)
+            for name in dirnames:
+                dirs.append(os.path.normpath("{0}/{1}".format(rel, name)))
+            for name in filenames:
+                files.append(os.path.normpath("{0}/{1}".format(rel, name)))
+        found = _listings[template] = (dirs, files)
+    return found
+
+
+def clone(template, dest):
+    # Returns {"reflink": n, "hardlink": n, "copy": n}
+    counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+    dirs, files = listing(template)
+    os.makedirs(dest)
+    dev = os.stat(dest).st_dev
+    # keeps prune() in other processes away from the template meanwhile
+    with lockfile(os.path.dirname(template)) as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        for name in dirs:
+            os.mkdir("{0}/{1}".format(dest, name))
+        for name in files:
+            counts[clone_file("{0}/{1}".format(template, name),
+                              "{0}/{1}".format(dest, name), name, dev)] += 1
+    return counts
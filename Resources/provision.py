@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+#
+# Headless bulk creation of Ice SSBs from a manifest.
+#
+#   provision.py apps.json [--jobs 8]
+#   provision.py apps.csv --no-validate
+#
+# The manifest is a JSON list of objects or a CSV file with a header row,
+# using the fields name, url, browser, category, icon and isolate:
+#
+#   browser   brave, chrome, chromium, vivaldi, firefox or epiphany
+#   category  a menu label (Internet) or Categories= value (Network;),
+#             Internet if empty
+#   icon      path to an icon, "favicon" to download the site's icon,
+#             or empty for the stock Ice icon
+#   isolate   true/false, for Chromium based browsers
+#
+# Apps are created on a bounded pool of worker threads using the same
+# code as the Ice window (ssb.py); no GTK or Qt is imported.
+
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import time
+
+import browsers
+import desktopdb
+import favicon
+import ssb
+import webclient
+
+_TRUE = ("1", "yes", "true", "on", "y")
+
+
+class Item:
+    __slots__ = ('line', 'name', 'url', 'browser', 'location', 'icon',
+                 'isolate')
+
+    def __init__(self, line, fields):
+        self.line = line
+        self.name = text(fields, "name")
+        self.url = text(fields, "url")
+        self.browser = (text(fields, "browser") or "chromium").lower()
+        self.location = location(text(fields, "category"))
+        self.icon = text(fields, "icon")
+        isolate = fields.get("isolate")
+        if isinstance(isolate, bool):
+            self.isolate = isolate
+        else:
+            self.isolate = str(isolate or "").strip().lower() in _TRUE
+
+
+def text(fields, key):
+    # JSON manifests can hold numbers, lists or objects where a string
+    # belongs; numbers are taken as written, the rest fails the row
+    value = fields.get(key)
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ssb.SSBError("Manifest",
+                           "{0} must be a string".format(key))
+    return value.strip()
+
+
+def location(category):
+    if category == "":
+        return ssb.category("Internet")
+    for label, value in ssb.CATEGORIES:
+        if category.lower() in (label.lower(), value.lower(),
+                                value.lower().rstrip(";")):
+            return value
+    raise ssb.SSBError("Category",
+                       "Unknown menu category: {0}".format(category))
+
+
+def read_manifest(path):
+    with open(path, newline='') as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+
+    items = []
+    errors = []
+    for line, fields in enumerate(rows, 1):
+        if not isinstance(fields, dict):
+            errors.append((line, "", "Not an object"))
+            continue
+        try:
+            items.append(Item(line, {str(k).lower(): v
+                                     for k, v in fields.items()}))
+        except ssb.SSBError as e:
+            errors.append((line, str(fields.get("name") or ""), str(e)))
+    return items, errors
+
+
+def provision(item, validate, favicons):
+    # Returns (appfile, warning) or raises ssb.SSBError
+    if item.browser not in browsers.BY_KEY:
+        raise ssb.SSBError("Browser",
+                           "Unknown browser: {0}".format(item.browser))
+    ssb.check(item.name)
+
+    url = ssb.normalize(item.url)
+    page = None
+    if validate:
+        page = webclient.client().page(url)
+        if page is None:
+            raise ssb.SSBError("Address",
+                               "Could not open {0}".format(url))
+
+    warning = None
+    iconpath = ssb.ICE_ICON
+    if item.icon == "favicon":
+        def fetch_page():
+            if page is not None:
+                return page.head
+            fetched = webclient.client().page(url)
+            return fetched.head if fetched is not None else None
+        try:
+            found = favicons.get(url, fetch_page,
+                                 session=webclient.client().session)
+        except ValueError:
+            found = None
+        if found is None:
+            warning = "no favicon found, using the stock icon"
+        else:
+            iconpath = found
+    elif item.icon != "":
+        if not os.path.isfile(item.icon):
+            raise ssb.SSBError("Icon",
+                               "Icon not found: {0}".format(item.icon))
+        iconpath = item.icon
+
+    appfile = ssb.create(item.name, url, item.browser, item.location,
+                         iconpath, item.isolate)
+    return appfile, warning
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create Ice SSBs from a JSON or CSV manifest"
+    )
+    parser.add_argument("manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="worker threads (default 4)")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="do not check that the addresses respond")
+    parser.add_argument("--report", metavar="FILE",
+                        help="also write the results as JSON to FILE")
+    args = parser.parse_args()
+
+    ssb.ensure_dirs()
+    items, failures = read_manifest(args.manifest)
+    results = []
+
+    # Two rows with the same name would race for the same .desktop file
+    seen = set()
+    unique = []
+    for item in items:
+        formatted = ssb.formatted_name(item.name)
+        if formatted in seen:
+            failures.append((item.line, item.name,
+                             "Duplicate name in manifest"))
+        else:
+            seen.add(formatted)
+            unique.append(item)
+
+    favicons = favicon.FaviconCache(ssb.FAVICON_DIR)
+    start = time.monotonic()
+    # the menu is refreshed once, after the last app
+    with desktopdb.refresher(ssb.APPS_DIR).batch(), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) \
+            as pool:
+        futures = {pool.submit(provision, item, not args.no_validate,
+                               favicons): item for item in unique}
+        for future in concurrent.futures.as_completed(futures):
+            item = futures[future]
+            try:
+                appfile, warning = future.result()
+            except (ssb.SSBError, OSError) as e:
+                failures.append((item.line, item.name, str(e)))
+                print("FAIL  {0}: {1}".format(item.name, e))
+                continue
+            except Exception as e:
+                # one bad row must not take the rest of the batch with it
+                message = "{0}: {1}".format(type(e).__name__, e)
+                failures.append((item.line, item.name, message))
+                print("FAIL  {0}: {1}".format(item.name, message))
+                continue
+            results.append((item.line, item.name, appfile, warning))
+            print("ok    {0} -> {1}".format(item.name, appfile))
+            if warning is not None:
+                print("      warning: {0}".format(warning))
+    elapsed = time.monotonic() - start
+
+    print("{0} created, {1} failed in {2:.2f}s ({3:.1f} apps/s)".format(
+        len(results), len(failures), elapsed,
+        len(results) / elapsed if elapsed > 0 else 0.0))
+    for line, name, message in sorted(failures):
+        print("  line {0} ({1}): {2}".format(line, name, message))
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({
+                "seconds": elapsed,
+                "created": [{"line": line, "name": name, "desktop": appfile,
+                             "warning": warning}
+                            for line, name, appfile, warning
+                            in sorted(results)],
+                "failed": [{"line": line, "name": name, "error": message}
+                           for line, name, message in sorted(failures)],
+                "http": webclient.client().stats(),
+            }, f, indent=2)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+#
+# Runs an SSB with its browser profile held in RAM.
+#
+#   ramprofile.py <profile dir> -- <browser command ...>
+#
+# The profile (an isolated Chromium --user-data-dir or an Ice Firefox
+# profile) is copied to tmpfs and every occurrence of its path in the
+# browser command is pointed at the copy. While the browser runs, a
+# background thread writes back only the files that changed since the
+# last sync (by mtime and size, or by content hash), each one through a
+# temporary file and rename. SQLite databases are written back with the
+# sqlite3 backup API, which gives a consistent copy of a database and
+# its journal while the browser is using them; a database the browser
+# holds locked (Firefox keeps some exclusively) waits for the final
+# sync, which runs when the browser exits and copies everything as is.
+# The on-disk profile is therefore always the last synced copy. SIGTERM
+# and SIGHUP (logout, shutdown) are passed on to the browser and the
+# final sync runs once it has exited. A RAM copy left behind when that
+# did not happen (a crash, SIGKILL) is written back the same way at the
+# next launch, before the profile is copied to RAM again.
+#
+# Launching the SSB again while it runs starts the browser on the RAM
+# copy too, never on the profile on disk that the first session keeps
+# writing to. Chromium hands the window over to the running instance;
+# Firefox SSBs are started with --no-remote, so Firefox refuses with its
+# "already running" message instead.
+#
+# Sync duration, files and bytes written are printed to stderr with
+# ICE_RAMPROFILE_VERBOSE=1 and kept in ~/.local/share/ice/ramsync.json.
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import config
+
+_SQLITE_MAGIC = b"SQLite format 3\0"
+# written next to a database by SQLite; never copied on their own
+_SIDE_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def runtime_root():
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        root = runtime + "/ice/ram"
+    else:
+        root = "/dev/shm/ice-{0}/ram".format(os.getuid())
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    return root
+
+
+def is_sqlite(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(16) == _SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RamProfile:
+
+    def __init__(self, persistent, compare="stat", settle=2.0):
+        self.persistent = os.path.abspath(persistent)
+        self.compare = compare
+        self.settle = settle
+        name = "{0}-{1}".format(
+            os.path.basename(self.persistent),
+            hashlib.sha1(self.persistent.encode()).hexdigest()[:8]
+        )
+        self.ram = "{0}/{1}".format(runtime_root(), name)
+        self.lock = threading.Lock()
+        self.lockfile = None
+        # relative path -> (size, mtime_ns, hash or None) as last synced
+        self.synced = {}
+        # database -> stat of it and its side files as last synced
+        self.databases = {}
+        self.metrics = {"syncs": 0, "seconds": 0.0, "files": 0, "bytes": 0,
+                        "deleted": 0, "last": None}
+
+    def acquire(self):
+        # One session per profile; see run() for a second launch
+        self.lockfile = open(self.ram + ".lock", "w")
+        try:
+            fcntl.flock(self.lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lockfile.close()
+            self.lockfile = None
+            return False
+        return True
+
+    def stage(self):
+        staging = self.ram + ".staging"
+        if os.path.isdir(self.ram):
+            self.recover()
+        shutil.rmtree(self.ram, ignore_errors=True)
+        # an unfinished copy never reached self.ram; just drop it
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(self.persistent, exist_ok=True)
+        shutil.copytree(self.persistent, staging, symlinks=True)
+        # a second launch only uses the RAM copy once it is complete
+        os.rename(staging, self.ram)
+        # copytree keeps mtimes, so the fresh copy is the synced state
+        self.synced, self.databases = self.split(self.scan())
+
+    def recover(self):
+        # The RAM copy is from a session that ended without its final
+        # sync, and holds what the browser last wrote. Taking the profile
+        # on disk as the synced state, a final sync writes back the files
+        # that differ and removes the ones the browser deleted.
+        self.synced, self.databases = self.split(self.scan(self.persistent))
+        self.sync(final=True)
+
+    def scan(self, root=None):
+        root = self.ram if root is None else root
+        found = {}
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            base = root + ("/" + rel if rel else "")
+            try:
+                entries = list(os.scandir(base))
+            except OSError:
+                continue
+            for entry in entries:
+                name = entry.name if not rel else rel + "/" + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        found[name] = (st.st_size, st.st_mtime_ns, None)
+                except OSError:
+                    continue
+        return found
+
+    def split(self, current):
+        # (plain files, {database: {file: state}}), where each database
+        # comes with its -wal, -shm and -journal files
+        databases = {}
+        for rel, state in current.items():
+            if rel.endswith(_SIDE_SUFFIXES):
+                continue
+            # only files that are new or changed need to be looked into
+            old = self.synced.get(rel)
+            if rel in self.databases or \
+                    (old is None or old[:2] != state[:2]) and \
+                    is_sqlite("{0}/{1}".format(self.ram, rel)):
+                databases[rel] = {}
+        plain = {}
+        for rel, state in current.items():
+            base = rel
+            for suffix in _SIDE_SUFFIXES:
+                if rel.endswith(suffix):
+                    base = rel[:-len(suffix)]
+            if base in databases:
+                databases[base][rel] = state[:2]
+            else:
+                plain[rel] = state
+        return plain, databases
+
+    def remove_persistent(self, rel):
+        try:
+            os.remove("{0}/{1}".format(self.persistent, rel))
+        except FileNotFoundError:
+            pass
+
+    def backup(self, rel):
+        # Consistent copy of a database in use; False while the browser
+        # holds it locked
+        src = "{0}/{1}".format(self.ram, rel)
+        dst = "{0}/{1}".format(self.persistent, rel)
+        tmp = dst + ".ice-sync-tmp"
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            source = sqlite3.connect("file:{0}?mode=ro".format(src),
+                                     uri=True, timeout=0,
+                                     isolation_level=None)
+            try:
+                # take the read lock now: backup() would wait for a busy
+                # database forever
+                source.execute("BEGIN")
+                source.execute("SELECT count(*) FROM sqlite_master")
+                target = sqlite3.connect(tmp)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+        except sqlite3.Error:
+            for path in [tmp] + [tmp + suffix for suffix in _SIDE_SUFFIXES]:
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+        # without its old journal the database on disk is an older but
+        # whole copy if we stop here
+        for suffix in _SIDE_SUFFIXES:
+            self.remove_persistent(rel + suffix)
+        os.replace(tmp, dst)
+        return True
+
+    def copy_database(self, rel, files):
+        # The browser has exited: the database and its side files are
+        # consistent as they are
+        for suffix in _SIDE_SUFFIXES:
+            if rel + suffix not in files:
+                self.remove_persistent(rel + suffix)
+        for name in sorted(files, key=lambda name: name == rel):
+            src = "{0}/{1}".format(self.ram, name)
+            dst = "{0}/{1}".format(self.persistent, name)
+            tmp = dst + ".ice-sync-tmp"
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, tmp)
+            os.replace(tmp, dst)
+
+    def changed(self, rel, state):
+        old = self.synced.get(rel)
+        if old is not None and old[:2] == state[:2]:
+            return False, old
+        if self.compare == "hash":
+            try:
+                digest = file_hash("{0}/{1}".format(self.ram, rel))
+            except OSError:
+                return False, old
+            state = state[:2] + (digest,)
+            if old is not None and old[2] == digest:
+                # touched but identical; remember the new stat only
+                return False, state
+        return True, state
+
+    def sync(self, final=False):
+        with self.lock:
+            start = time.monotonic()
+            now = time.time_ns()
+            current, databases = self.split(self.scan())
+            files = 0
+            written = 0
+            deleted = 0
+
+            for rel, states in databases.items():
+                if self.databases.get(rel) == states:
+                    continue
+                if not final and any(now - mtime < self.settle * 1e9
+                                     for size, mtime in states.values()):
+                    continue
+                try:
+                    if final:
+                        self.copy_database(rel, states)
+                    elif not self.backup(rel):
+                        continue
+                except OSError:
+                    continue
+                self.databases[rel] = states
+                files += 1
+                written += states[rel][0]
+
+            for rel in [rel for rel in self.databases
+                        if rel not in databases]:
+                try:
+                    for name in [rel] + [rel + suffix
+                                         for suffix in _SIDE_SUFFIXES]:
+                        self.remove_persistent(name)
+                except OSError:
+                    continue
+                del self.databases[rel]
+                deleted += 1
+
+            for rel, state in current.items():
+                # Outside the final sync leave files that are still being
+                # written alone; they are picked up next time.
+                if not final and now - state[1] < self.settle * 1e9:
+                    continue
+                is_changed, state = self.changed(rel, state)
+                if not is_changed:
+                    if state is not None:
+                        self.synced[rel] = state
+                    continue
+                src = "{0}/{1}".format(self.ram, rel)
+                dst = "{0}/{1}".format(self.persistent, rel)
+                tmp = dst + ".ice-sync-tmp"
+                try:
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.copy2(src, tmp)
+                    os.replace(tmp, dst)
+                except OSError:
+                    continue
+                self.synced[rel] = state
+                files += 1
+                written += state[0]
+
+            for rel in [rel for rel in self.synced if rel not in current]:
+                try:
+                    os.remove("{0}/{1}".format(self.persistent, rel))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del self.synced[rel]
+                deleted += 1
+
+            elapsed = time.monotonic() - start
+            self.metrics["syncs"] += 1
+            self.metrics["seconds"] += elapsed
+            self.metrics["files"] += files
+            self.metrics["bytes"] += written
+            self.metrics["deleted"] += deleted
+            self.metrics["last"] = {"seconds": elapsed, "files": files,
+                                    "bytes": written, "deleted": deleted,
+                                    "final": final}
+            if os.getenv("ICE_RAMPROFILE_VERBOSE"):
+                sys.stderr.write(
+                    "ramprofile: synced {0} files ({1} bytes), removed {2} "
+                    "in {3:.1f} ms\n".format(files, written, deleted,
+                                             elapsed * 1000)
+                )
+
+    def syncer(self, interval, stop):
+        while not stop.wait(interval):
+            self.sync()
+
+    def run(self, command, interval):
+        if not self.acquire():
+            # Already running: start the browser on the RAM copy, never
+            # on the profile on disk, which the first session keeps
+            # writing to
+            if not os.path.isdir(self.ram):
+                sys.stderr.write("ramprofile: {0} is still being loaded, "
+                                 "try again\n".format(self.persistent))
+                return 1
+            return subprocess.call([arg.replace(self.persistent, self.ram)
+                                    for arg in command])
+
+        self.stage()
+        command = [arg.replace(self.persistent, self.ram) for arg in command]
+        stop = threading.Event()
+        thread = threading.Thread(target=self.syncer, args=(interval, stop))
+        thread.daemon = True
+        thread.start()
+        previous = {}
+        try:
+            browser = subprocess.Popen(command)
+
+            def forward(signum, frame):
+                # let the browser shut down; the final sync follows
+                browser.send_signal(signum)
+
+            for signum in (signal.SIGTERM, signal.SIGHUP):
+                previous[signum] = signal.signal(signum, forward)
+            status = browser.wait()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            stop.set()
+            thread.join()
+            self.sync(final=True)
+            shutil.rmtree(self.ram, ignore_errors=True)
+            self.record()
+            self.lockfile.close()
+        return status
+
+    def record(self):
+        path = "{0}/.local/share/ice/ramsync.json".format(os.getenv("HOME"))
+        try:
+            with open(path) as f:
+                everything = json.load(f)
+        except (OSError, ValueError):
+            everything = {}
+        everything[self.persistent] = self.metrics
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(everything, f, indent=2)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+def main():
+    args = sys.argv[1:]
+    if "--" not in args or args.index("--") != 1 or len(args) < 3:
+        sys.stderr.write("usage: ramprofile.py <profile dir> -- "
+                         "<browser command ...>\n")
+        return 2
+
+    profile = RamProfile(args[0],
+                         compare=config.get("ramprofile", "compare"),
+                         settle=config.getfloat("ramprofile", "settle"))
+    return profile.run(args[2:], config.getfloat("ramprofile", "interval"))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
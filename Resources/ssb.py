@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+#
+# The parts of Ice that create and remove SSBs, without any GUI.
+#
+# ice.py (the GTK window) and provision.py (headless bulk creation) both
+# build on these functions; nothing here imports Gtk or Qt, and nothing
+# keeps state between calls, so they can run on worker threads.
+
+import os
+import shutil
+import time
+import urllib.parse
+
+import browsers
+import config
+import desktopdb
+import desktopentry
+import icontheme
+import profiletemplate
+
+HOME = os.getenv("HOME")
+ICE_DIR = "{0}/.local/share/ice".format(HOME)
+APPS_DIR = "{0}/.local/share/applications".format(HOME)
+PROFILES_DIR = "{0}/profiles".format(ICE_DIR)
+FF_PROFILES_DIR = "{0}/firefox".format(ICE_DIR)
+EPIPHANY_PROFILES_DIR = "{0}/epiphany".format(ICE_DIR)
+ICE_ICON = "/usr/share/pixmaps/ice.png"
+ICON_DIR = "{0}/icons".format(ICE_DIR)
+CATALOG_DB = "{0}/catalog.db".format(ICE_DIR)
+THUMB_DIR = "{0}/thumbnails".format(ICE_DIR)
+FAVICON_DIR = "{0}/favicons".format(ICE_DIR)
+FF_TEMPLATE_DIR = "/usr/lib/peppermint/ice"
+TEMPLATES_DIR = "{0}/templates".format(ICE_DIR)
+# profiles are renamed in here before they are deleted
+TRASH_DIR = "{0}/trash".format(ICE_DIR)
+
+# Exec= prefix that runs the browser with its profile in RAM
+RAMPROFILE = "python3 {0}/ramprofile.py".format(
+    os.path.dirname(os.path.abspath(__file__))
+)
+
+# menu label, Categories= value
+CATEGORIES = [
+    ("Accessories", "Utility;"),
+    ("Games", "Game;"),
+    ("Graphics", "Graphics;"),
+    ("Internet", "Network;"),
+    ("Office", "Office;"),
+    ("Programming", "Development;"),
+    ("Multimedia", "AudioVideo;"),
+    ("System", "System;"),
+]
+
+FIREFOX_CSS = ("#nav-bar, #identity-box, #tabbrowser-tabs, "
+               "#TabsToolbar { visibility: collapse !important; }")
+
+FIREFOX_PREFS = [
+    'user_pref("browser.cache.disk.enable", false);',
+    'user_pref("browser.cache.disk.capacity", 0);',
+    'user_pref("browser.cache.disk.filesystem_reported", 1);',
+    'user_pref("browser.cache.disk.smart_size.enabled", false);',
+    'user_pref("browser.cache.disk.smart_size.first_run", false);',
+    'user_pref("browser.cache.disk.smart_size.use_old_max", false);',
+    'user_pref("browser.ctrlTab.previews", true);',
+    'user_pref("browser.tabs.drawInTitlebar", false);',
+    'user_pref("browser.tabs.warnOnClose", false);',
+    'user_pref("browser.toolbars.bookmarks.visibility", false);',
+    'user_pref("plugin.state.flash", 2);',
+    'user_pref("toolkit.legacyUserProfileCustomizations.stylesheets", true);',
+]
+
+
+class SSBError(Exception):
+    # kind is one of "Duplicate", "Name" (the errors Ice reports),
+    # "Browser" for an unknown browser key or "Category" for an unknown
+    # menu category. Callers raise their own kinds too: "Address",
+    # "Icon" and "Manifest" (provision.py), "URL" and "Icon" (cloudz.py).
+
+    def __init__(self, kind, message):
+        Exception.__init__(self, message)
+        self.kind = kind
+
+
+def ensure_dirs():
+    for directory in [ICE_DIR, APPS_DIR, PROFILES_DIR,
+                      FF_PROFILES_DIR, ICON_DIR, EPIPHANY_PROFILES_DIR]:
+        os.makedirs(directory, exist_ok=True)
+
+
+def normalize(url):
+    (scheme, netloc, path, _, _, _) = urllib.parse.urlparse(url, "http")
+
+    if not netloc and path:
+        return urllib.parse.urlunparse((scheme, path, "", "", "", ""))
+
+    return urllib.parse.urlunparse((scheme, netloc, path, "", "", ""))
+
+
+def formatted_name(title):
+    return "".join(filter(str.isalpha, title)).lower()
+
+
+def category(label):
+    for name, value in CATEGORIES:
+        if label == name:
+            return value
+    raise SSBError("Category", "Unknown menu category: {0}".format(label))
+
+
+def appfile_path(formatted):
+    return "{0}/{1}.desktop".format(APPS_DIR, formatted)
+
+
+def check(title):
+    if len(title) == 0:
+        raise SSBError("Name", "No application name entered.")
+    if os.path.exists(appfile_path(formatted_name(title))):
+        raise SSBError("Duplicate",
+                       "An SSB named {0} already exists.".format(title))
+
+
+def create(title, url, browser, location, iconpath=ICE_ICON,
+           isolate=False):
+    # browser is a key of browsers.BY_KEY, location a Categories= value
+    check(title)
+    formatted = formatted_name(title)
+    iconext = iconpath.replace("/", " ").split()[-1]
+    iconext = iconext.replace(".", " ").split()[-1]
+    return writefile(title, formatted, normalize(url), iconpath, iconext,
+                     location, browser, isolate)
+
+
+def ram_wrapped(command, profile_path, ram):
+    if ram is None:
+        ram = config.getboolean("ramprofile", "enabled")
+    if not ram:
+        return command
+    return "{0} {1} -- {2}".format(RAMPROFILE, profile_path, command)
+
+
+def writefile(title, formatted, address, iconpath, iconext, location,
+              browser, isolate, ram=None):
+    # ram: hold the Firefox or isolated profile in RAM (see ramprofile.py);
+    # None follows the [ramprofile] enabled setting
+    if browser not in browsers.BY_KEY:
+        raise SSBError("Browser", "Unknown browser: {0}".format(browser))
+    command = browsers.command(browser)
+    engine = browsers.BY_KEY[browser].engine
+    ensure_dirs()
+
+    # the copy in ICON_DIR is kept as the source of the theme icons
+    iconfile = "{0}/{1}.{2}".format(ICON_DIR, formatted, iconext)
+    shutil.copyfile(iconpath, iconfile)
+    appfile = os.path.expanduser(appfile_path(formatted))
+
+    lines = [
+        "[Desktop Entry]",
+        "Version=1.0",
+        "Name={0}".format(title),
+        "Comment={0} (Ice SSB)".format(title),
+    ]
+
+    if engine == browsers.FIREFOX:
+        firefox_profile_path = "{0}/{1}".format(FF_PROFILES_DIR, formatted)
+        command = ram_wrapped(command, firefox_profile_path, ram)
+        lines.append("Exec=" + command + " --class ICE-SSB-" + formatted +
+                     " --profile " + firefox_profile_path +
+                     " --no-remote " + address)
+        lines.append("IceFirefox={0}".format(formatted))
+        init_firefox_profile(firefox_profile_path)
+    elif engine == browsers.EPIPHANY:
+        epiphany_profile_path = "{0}/{1}".format(
+            EPIPHANY_PROFILES_DIR, "epiphany-" + formatted
+        )
+        lines.append("Exec={0} --application-mode --profile=\"{2}\" "
+                     "{1}".format(command, address, epiphany_profile_path))
+        lines.append("IceEpiphany={0}".format(formatted))
+    elif isolate is True:
+        profile_path = "{0}/{1}".format(PROFILES_DIR, formatted)
+        command = ram_wrapped(command, profile_path, ram)
+        lines.append("Exec=" + command + " --app=" + address +
+                     " --class=ICE-SSB-" + formatted +
+                     " --user-data-dir=" + profile_path)
+        lines.append("X-ICE-SSB-Profile=" + formatted)
+    else:
+        lines.append("Exec=" + command + " --app=" + address +
+                     " --class=ICE-SSB-" + formatted)
+
+    lines.append("Terminal=false")
+    lines.append("X-MultipleArgs=false")
+    lines.append("Type=Application")
+    if engine == browsers.EPIPHANY:
+        lines.append("Icon={0}/app-icon.{1}".format(epiphany_profile_path,
+                                                    iconext))
+    elif icontheme.render(iconfile, icontheme.icon_name(formatted)):
+        lines.append("Icon={0}".format(icontheme.icon_name(formatted)))
+    else:
+        lines.append("Icon={0}".format(iconfile))
+
+    lines.append("Categories=GTK;{0}".format(location))
+    lines.append("MimeType=text/html;text/xml;application/xhtml_xml;")
+    lines.append("StartupWMClass=ICE-SSB-{0}".format(formatted))
+    lines.append("StartupNotify=true")
+
+    if engine == browsers.EPIPHANY:
+        init_epiphany_profile(epiphany_profile_path, formatted, iconext,
+                              appfile, lines)
+    else:
+        write_desktop(appfile, lines)
+
+    desktopdb.refresher(APPS_DIR).changed()
+    return appfile
+
+
+def write_desktop(path, lines):
+    # Readers (and the menu, which watches APPS_DIR) only ever see the
+    # whole file; the temporary name does not end in .desktop
+    tmp = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def init_firefox_profile(path):
+    template = profiletemplate.build(
+        TEMPLATES_DIR, "firefox",
+        profiletemplate.firefox_files(FF_TEMPLATE_DIR, FIREFOX_CSS,
+                                      FIREFOX_PREFS)
+    )
+    return profiletemplate.clone(template, path)
+
+
+def init_epiphany_profile(path, formatted, iconext, appfile, lines):
+    os.makedirs(path)
+    shutil.copyfile("{0}/{1}.{2}".format(ICON_DIR, formatted, iconext),
+                    "{0}/app-icon.{1}".format(path, iconext))
+    # subprocess.run(["touch", path + "/.app"])
+    target = "{0}/epiphany-{1}.desktop".format(path, formatted)
+    write_desktop(target, lines)
+    tmp = "{0}.{1}.tmp".format(appfile, os.getpid())
+    os.symlink(target, tmp)
+    os.replace(tmp, appfile)
+
+
+def profile_dir(details):
+    if details.isolation == desktopentry.FIREFOX:
+        return "{0}/{1}".format(FF_PROFILES_DIR, details.profile)
+    elif details.isolation == desktopentry.EPIPHANY:
+        return "{0}/epiphany-{1}".format(EPIPHANY_PROFILES_DIR,
+                                         details.profile)
+    elif details.isolation == desktopentry.ISOLATED:
+        return "{0}/{1}".format(PROFILES_DIR, details.profile)
+    return None
+
+
+def discard(appfile):
+    # Removes the SSB's menu entry and icons and moves its profile to the
+    # trash; returns the paths for purge() to delete
+    details = desktopentry.parse(appfile)
+    os.remove(appfile)
+    desktopdb.refresher(APPS_DIR).changed()
+    if details is None:
+        return []
+    if details.icon.startswith(icontheme.PREFIX):
+        icontheme.remove(details.icon)
+    path = profile_dir(details)
+    if path is None or not os.path.isdir(path):
+        return []
+    try:
+        return [trash(path)]
+    except OSError:
+        # on another filesystem; delete it where it is
+        return [path]
+
+
+def delete(appfile):
+    for path in discard(appfile):
+        purge(path)
+
+
+def icon_path(icon, size):
+    # File to draw for an Icon= value (a path, or a theme icon name)
+    if os.path.isabs(icon):
+        return icon
+    return icontheme.lookup(icon, size) or ICE_ICON
+
+
+def icon_source(formatted):
+    # The icon an SSB was created with, as copied to ICON_DIR
+    try:
+        entries = list(os.scandir(ICON_DIR))
+    except FileNotFoundError:
+        return None
+    for entry in entries:
+        if os.path.splitext(entry.name)[0] == formatted:
+            return entry.path
+    return None
+
+
+def use_theme_icon(appfile, name):
+    # Points an existing .desktop file's Icon= at theme icon name
+    with open(appfile) as f:
+        lines = f.read().splitlines()
+    lines = ["Icon=" + name if line.startswith("Icon=") else line
+             for line in lines]
+    write_desktop(appfile, lines)
+    desktopdb.refresher(APPS_DIR).changed()
+
+
+def human_size(n):
+    if n < 1024:
+        return "{0} B".format(n)
+    for unit in ["KB", "MB", "GB"]:
+        n /= 1024
+        if n < 1024 or unit == "GB":
+            return "{0:.1f} {1}".format(n, unit)
+
+
+def trash(path):
+    # Move path out of the way with a single rename (TRASH_DIR is on the
+    # same filesystem as every profile) and return where it went; the
+    # slow part, empty_trash(), can then run whenever it suits.
+    os.makedirs(TRASH_DIR, exist_ok=True)
+    target = "{0}/{1}.{2}.{3}".format(TRASH_DIR, os.path.basename(path),
+                                      os.getpid(), time.time_ns())
+    os.rename(path, target)
+    return target
+
+
+def empty_trash():
+    if not os.path.isdir(TRASH_DIR):
+        return
+    for entry in os.scandir(TRASH_DIR):
+        purge(entry.path)
+
+
+def purge(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# On-disk cache of the small icons drawn on the Remove page.
+#
+# SSB icons are often full size PNG/SVG files or og:images, and decoding
+# them only to draw a 16px tile made start up time grow with icon size.
+# Thumbnails are rendered once, keyed by the source path, mtime and size,
+# and the cache directory is kept under a byte budget by dropping the
+# least recently used files.
+
+import hashlib
+import os
+import queue
+import threading
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GLib
+from gi.repository.GdkPixbuf import Pixbuf
+
+
+class ThumbnailCache:
+
+    def __init__(self, cache_dir, size=16, max_bytes=2 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total = 0
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    self.total += entry.stat().st_size
+
+    def thumbpath(self, source):
+        st = os.stat(source)
+        key = "{0}\0{1}\0{2}\0{3}".format(os.path.realpath(source),
+                                          st.st_mtime_ns, st.st_size,
+                                          self.size)
+        digest = hashlib.sha1(key.encode('utf-8', 'surrogateescape'))
+        return "{0}/{1}.png".format(self.cache_dir, digest.hexdigest())
+
+    def get(self, source):
+        thumb = self.thumbpath(source)
+        try:
+            pixbuf = Pixbuf.new_from_file(thumb)
+        except GLib.Error:
+            return self.render(source, thumb)
+
+        # mtime doubles as the last use time for eviction
+        try:
+            os.utime(thumb)
+        except OSError:
+            pass
+        return pixbuf
+
+    def render(self, source, thumb):
+        pixbuf = Pixbuf.new_from_file_at_size(source, self.size, self.size)
+
+        tmp = "{0}.{1}.tmp".format(thumb, threading.get_ident())
+        try:
+            pixbuf.savev(tmp, "png", [], [])
+            os.replace(tmp, thumb)
+        except (GLib.Error, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return pixbuf
+
+        with self.lock:
+            self.total += os.path.getsize(thumb)
+            if self.total > self.max_bytes:
+                self.evict()
+        return pixbuf
+
+    def evict(self):
+        files = []
+        self.total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    files.append((st.st_mtime_ns, st.st_size, entry.path))
+                    self.total += st.st_size
+
+        files.sort()
+        for mtime, size, path in files:
+            if self.total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total -= size
+
+
+class ThumbnailLoader(threading.Thread):
+    # Decodes thumbnails off the GTK main loop and hands each one back
+    # through GLib.idle_add so the caller can swap out its placeholder.
+
+    def __init__(self, cache):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.cache = cache
+        self.queue = queue.Queue()
+
+    def request(self, source, callback, *args):
+        self.queue.put((source, callback, args))
+
+    def run(self):
+        while True:
+            source, callback, args = self.queue.get()
+            try:
+                pixbuf = self.cache.get(source)
+            except (GLib.Error, OSError):
+                continue
+            GLib.idle_add(callback, pixbuf, *args)
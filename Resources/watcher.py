@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#
+# Tells Ice about entries that appear, change or go away in a set of
+# directories, so the Remove page can follow SSBs made or removed by
+# other tools (or another Ice) without reading the whole directory
+# again.
+#
+# Uses inotify through ctypes. Where that is not available (no inotify
+# in libc, the per-user watch limit reached, or [watcher] inotify =
+# false for home directories on NFS) the directories are polled every
+# [watcher] poll seconds instead, comparing each entry's mtime and size.
+# Either way, events are gathered for [watcher] settle seconds so that a
+# file written in several steps is reported once, and the callback gets
+# (directory, names) with the set of entry names that changed, or None
+# for names when events were lost and anything may have changed.
+#
+# Only the entries directly in each directory are watched, not their
+# subdirectories: a profile appearing or being removed is reported, a
+# browser writing inside it is not.
+#
+#   watcher.py [directory...]   print changes as they happen
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import config
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+
+_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+         _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+
+# struct inotify_event without its name
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+
+    def __init__(self):
+        path = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(path, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                                ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise self.error()
+        # watch descriptor -> directory
+        self.watches = {}
+
+    def error(self):
+        errno = ctypes.get_errno()
+        return OSError(errno, os.strerror(errno))
+
+    def add(self, directory, mask=_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                         mask)
+        if wd < 0:
+            raise self.error()
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        # [(directory, name or None for the directory itself, mask)];
+        # directory is None when the kernel's queue overflowed
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                events.append((None, None, mask))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & _IN_IGNORED:
+                # the directory went away; it is watched again if it
+                # comes back
+                del self.watches[wd]
+            events.append((directory, os.fsdecode(name) if name else None,
+                           mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def snapshot(directory):
+    # {name: (mtime_ns, size)} of the entries directly in directory
+    found = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                found[entry.name] = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        pass
+    return found
+
+
+class Watcher(threading.Thread):
+    # Calls callback(directory, names) on its own thread; callers that
+    # touch GTK widgets hand the result over with GLib.idle_add.
+
+    def __init__(self, directories, callback, settle=None, poll=None,
+                 use_inotify=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.directories = list(directories)
+        self.callback = callback
+        self.settle = config.getfloat("watcher", "settle") \
+            if settle is None else settle
+        self.poll = config.getfloat("watcher", "poll") \
+            if poll is None else poll
+        if use_inotify is None:
+            use_inotify = config.getboolean("watcher", "inotify")
+        self.use_inotify = use_inotify
+        self.stopped = threading.Event()
+        self.mode = None
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = Inotify()
+            except (OSError, AttributeError):
+                inotify = None
+        if inotify is None:
+            self.mode = "poll"
+            self.run_polling()
+            return
+        self.mode = "inotify"
+        try:
+            self.run_inotify(inotify)
+        except OSError:
+            # out of watches; keep going the slow way
+            self.mode = "poll"
+            self.run_polling()
+        finally:
+            inotify.close()
+
+    def watch_missing(self, inotify):
+        # Directories that do not exist (yet) are tried again now and
+        # then; returns the ones that came into being
+        added = []
+        watched = set(inotify.watches.values())
+        for directory in self.directories:
+            if directory in watched or not os.path.isdir(directory):
+                continue
+            try:
+                inotify.add(directory)
+            except FileNotFoundError:
+                continue
+            added.append(directory)
+        return added
+
+    def run_inotify(self, inotify):
+        self.watch_missing(inotify)
+        while not self.stopped.is_set():
+            pending = {}
+            lost = False
+            events = inotify.read(self.poll)
+            # one write often comes as several events; wait for the rest
+            deadline = time.monotonic() + self.settle
+            while events:
+                for directory, name, mask in events:
+                    if directory is None:
+                        lost = True
+                    elif name is None:
+                        # the directory itself was removed or moved
+                        pending[directory] = None
+                    elif pending.get(directory, set()) is not None:
+                        pending.setdefault(directory, set()).add(name)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                events = inotify.read(remaining)
+
+            for directory in self.watch_missing(inotify):
+                # its entries were made before the watch was in place
+                pending[directory] = None
+            if lost:
+                pending = {directory: None for directory in self.directories}
+            for directory, names in pending.items():
+                self.callback(directory, names)
+
+    def run_polling(self):
+        known = {directory: snapshot(directory)
+                 for directory in self.directories}
+        while not self.stopped.wait(self.poll):
+            for directory in self.directories:
+                current = snapshot(directory)
+                before = known[directory]
+                changed = {name for name in current
+                           if before.get(name) != current[name]}
+                changed.update(name for name in before if name not in current)
+                known[directory] = current
+                if changed:
+                    self.callback(directory, changed)
+
+
+def main():
+    directories = sys.argv[1:] or [os.getcwd()]
+
+    def show(directory, names):
+        if names is None:
+            print("{0}: rescan".format(directory), flush=True)
+        else:
+            for name in sorted(names):
+                print(os.path.join(directory, name), flush=True)
+
+    watcher = Watcher(directories, show)
+    watcher.start()
+    try:
+        while watcher.is_alive():
+            watcher.join(1)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# The one HTTP client used by Ice.
+#
+# Creating an SSB touches the site several times: the address is
+# validated, the page is read for icon links and the icons themselves are
+# downloaded. All of it goes through a single keep-alive connection pool
+# with timeouts, and the page fetched for validation is kept for a short
+# while so discovering its icons does not GET it again. The counters
+# show how many round trips that saved.
+
+import threading
+import time
+
+import requests
+import requests.adapters
+
+# connect, read
+TIMEOUT = (3.05, 10)
+# Icon links live in <head>; this is all that is kept of a page.
+_PAGE_BYTES = 512 * 1024
+_PAGE_TTL = 120
+
+
+class Page:
+    __slots__ = ('url', 'status', 'head', 'fetched')
+
+    def __init__(self, url, status, head):
+        self.url = url
+        self.status = status
+        self.head = head
+        self.fetched = time.monotonic()
+
+
+class WebClient:
+
+    def __init__(self, timeout=TIMEOUT, pool_size=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.hooks["response"].append(self.count)
+
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.requests = 0
+        self.reused = 0
+
+    def count(self, response, *args, **kwargs):
+        with self.lock:
+            self.requests += 1
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def page(self, url):
+        # Returns the Page for url (status < 400) or None if the address
+        # does not work, reusing a recent fetch of the same url.
+        with self.lock:
+            page = self.pages.get(url)
+            if page is not None and \
+                    time.monotonic() - page.fetched < _PAGE_TTL:
+                self.reused += 1
+                return page
+
+        try:
+            with self.get(url, stream=True) as r:
+                if r.status_code >= 400:
+                    return None
+                chunks = []
+                total = 0
+                tail = b""
+                for chunk in r.iter_content(16 * 1024):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    # </head> may be split between two chunks
+                    window = tail + chunk.lower()
+                    if total >= _PAGE_BYTES or b"</head>" in window:
+                        break
+                    tail = window[-(len(b"</head>") - 1):]
+        except requests.RequestException:
+            return None
+
+        page = Page(url, r.status_code, b"".join(chunks))
+        with self.lock:
+            for old in [u for u, p in self.pages.items()
+                        if page.fetched - p.fetched >= _PAGE_TTL]:
+                del self.pages[old]
+            self.pages[url] = page
+        return page
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "reused": self.reused}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WebClient()
+        return _client
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Event loop stall of the Cloudz window while an app is created.
+#
+# Serves a deliberately slow site on localhost (the page and its icon
+# each take --delay seconds), fills in the Cloudz form and presses
+# Create, while a 5 ms QTimer records how late each tick fires. The
+# longest gap is how long the form was frozen. For comparison the same
+# CreateJob is then run directly on the GUI thread, as a synchronous
+# Create button would.
+#
+#   QT_QPA_PLATFORM=offscreen python3 bench/bench_cloudz_stall.py
+#   python3 bench/bench_cloudz_stall.py --delay 2 --max-ms 100
+#
+# Both runs must end with the app created (the finished signal and the
+# .desktop file), else the bench stops with an error. Exits with status
+# 1 when the worst stall with the thread pool is over --max-ms.
+
+import argparse
+import http.server
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+_RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "Resources")
+
+# ssb and friends read HOME when they are imported
+os.environ["HOME"] = tempfile.mkdtemp(prefix="ice-bench-home-")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, _RESOURCES)
+
+from PyQt5.QtCore import QElapsedTimer, QTimer  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import cloudz  # noqa: E402
+
+# 1x1 transparent PNG
+_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44"
+    "ae426082"
+)
+
+
+def slow_server(delay):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            if self.path.startswith("/icon"):
+                body, kind = _PNG, "image/png"
+            else:
+                body = (b"<html><head><link rel='icon' href='/icon.png'>"
+                        b"</head><body></body></html>")
+                kind = "text/html"
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class Ticker:
+    # Records the gap between consecutive ticks of a 5 ms timer
+
+    def __init__(self):
+        self.gaps = []
+        self.clock = QElapsedTimer()
+        self.timer = QTimer()
+        self.timer.setInterval(5)
+        self.timer.timeout.connect(self.tick)
+        self.last = None
+
+    def start(self):
+        self.clock.start()
+        self.last = self.clock.elapsed()
+        self.timer.start()
+
+    def tick(self):
+        now = self.clock.elapsed()
+        self.gaps.append(now - self.last)
+        self.last = now
+
+    def stop(self):
+        self.timer.stop()
+        # whatever was still blocking when the job ended
+        self.tick()
+        return self.gaps
+
+
+def created(appfiles, status):
+    # A create that failed early would make the stall look small
+    if len(appfiles) != 1 or not os.path.isfile(appfiles[0]):
+        raise SystemExit("create did not finish: " + status)
+
+
+def threaded(app, window, url, name):
+    ticker = Ticker()
+    window.webUrlEdit.setText(url)
+    window.appNameEdit.setText(name)
+    # createApp connects the job to whatever createFinished is now
+    appfiles = []
+    finished = window.createFinished
+
+    def record(appfile, warning):
+        appfiles.append(appfile)
+        finished(appfile, warning)
+
+    window.createFinished = record
+    ticker.start()
+    window.createApp()
+    # the window drops its job when the finished (or failed) signal
+    # arrives
+    while window.job is not None:
+        app.processEvents()
+        time.sleep(0.001)
+    gaps = ticker.stop()
+    created(appfiles, window.status.text())
+    return gaps, window.status.text()
+
+
+def blocking(app, url, name, browser):
+    ticker = Ticker()
+    ticker.start()
+    app.processEvents()
+    job = cloudz.CreateJob(name, url, browser, True, "")
+    appfiles = []
+    errors = []
+    job.signals.finished.connect(lambda appfile, warning:
+                                 appfiles.append(appfile))
+    job.signals.failed.connect(lambda kind, message: errors.append(message))
+    job.run()
+    app.processEvents()
+    gaps = ticker.stop()
+    created(appfiles, "; ".join(errors))
+    return gaps
+
+
+def summary(gaps):
+    return "worst {0:.0f} ms, median {1:.0f} ms over {2} ticks".format(
+        max(gaps), statistics.median(gaps), len(gaps))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=1.0,
+                        help="seconds the test site takes per request")
+    parser.add_argument("--max-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    # two sites, so the blocking run cannot reuse cached pages or icons
+    server = slow_server(args.delay)
+    other = slow_server(args.delay)
+    url = "http://127.0.0.1:{0}/".format(server.server_address[1])
+
+    app = QApplication(sys.argv)
+    window = cloudz.Cloudz()
+    browser = window.selectedBrowser() or cloudz.browsers.TABLE[0].key
+    for key, radio in window.browserButtons.items():
+        radio.setEnabled(True)
+        radio.setChecked(key == browser)
+
+    gaps, status = threaded(app, window, url, "Stall Test")
+    print("thread pool: {0} ({1})".format(summary(gaps), status))
+    print("blocking:    {0}".format(
+        summary(blocking(app, "http://localhost:{0}/".format(
+            other.server_address[1]), "Stall Test 2", browser))))
+
+    server.shutdown()
+    other.shutdown()
+    shutil.rmtree(os.environ["HOME"], ignore_errors=True)
+    if max(gaps) > args.max_ms:
+        print("FAIL: the form was frozen for {0:.0f} ms (budget {1:.0f} "
+              "ms)".format(max(gaps), args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+#
+# Counts the desktop database refreshes and the change notifications the
+# menu gets when a batch of SSBs is created and then removed.
+#
+# Runs in a throwaway HOME with stub update-desktop-database,
+# xdg-desktop-menu and browser executables on PATH; the stubs record
+# each run. An inotify watch on the applications directory counts the
+# events a menu monitor would be woken by (modify, close-write, create,
+# delete and rename on .desktop names). The same batch written the old
+# way (each line written straight to the final path, then a refresh per
+# file) is measured for comparison.
+#
+# The new batches go through desktopdb batch() as provision.py and the
+# Remove page do, and creating pauses --pause seconds per app (longer
+# than the debounce delay, like a site fetch would) so that the single
+# refresh comes from the batch and not from a tight loop.
+#
+#   python3 bench/bench_desktop_refresh.py [--count 100] [--max-runs 1]
+#                                          [--pause 0.25]
+#
+# Exits with status 1 when creating or removing the batch took more than
+# --max-runs refreshes.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_RESOURCES = os.path.abspath(os.path.join(os.path.dirname(__file__), "..",
+                                          "Resources"))
+
+# ssb and friends read HOME when they are imported
+_HOME = tempfile.mkdtemp(prefix="ice-bench-home-")
+os.environ["HOME"] = _HOME
+os.environ["ICE_DESKTOPDB_DELAY"] = "0.2"
+sys.path.insert(0, _RESOURCES)
+
+import desktopdb  # noqa: E402
+import ssb  # noqa: E402
+import watcher  # noqa: E402
+
+_STUB = """#!/bin/sh
+echo "$0 $*" >> "$ICE_BENCH_LOG"
+"""
+
+_MENU_EVENTS = (watcher._IN_MODIFY | watcher._IN_CLOSE_WRITE |
+                watcher._IN_CREATE | watcher._IN_DELETE |
+                watcher._IN_MOVED_FROM | watcher._IN_MOVED_TO)
+
+
+def make_stubs(directory):
+    os.makedirs(directory)
+    for name in ["update-desktop-database", "xdg-desktop-menu", "chromium"]:
+        path = "{0}/{1}".format(directory, name)
+        with open(path, "w") as f:
+            f.write(_STUB)
+        os.chmod(path, 0o755)
+
+
+class EventCounter(threading.Thread):
+
+    def __init__(self, directory):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.inotify = watcher.Inotify()
+        self.inotify.add(directory, _MENU_EVENTS | watcher._IN_ONLYDIR)
+        self.events = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for directory, name, mask in self.inotify.read(0.05):
+                if name is not None and name.endswith(".desktop"):
+                    self.events += 1
+
+    def stop(self):
+        # let the last events arrive
+        time.sleep(0.2)
+        self.stopped.set()
+        self.join()
+        self.inotify.close()
+        return self.events
+
+
+def refreshes(log):
+    # number of update-desktop-database runs so far
+    try:
+        with open(log) as f:
+            return sum(1 for line in f if "update-desktop-database" in line)
+    except FileNotFoundError:
+        return 0
+
+
+def app_names(prefix, count):
+    # formatted_name() keeps letters only, so number the apps in letters
+    names = []
+    for i in range(count):
+        suffix = ""
+        while True:
+            i, digit = divmod(i, 26)
+            suffix += "abcdefghijklmnopqrstuvwxyz"[digit]
+            if i == 0:
+                break
+        names.append("{0} {1}".format(prefix, suffix))
+    return names
+
+
+def legacy_create(names, icon):
+    # What writefile used to do: each line to the final path in turn
+    for name in names:
+        formatted = ssb.formatted_name(name)
+        appfile = ssb.appfile_path(formatted)
+        with open(appfile, "w") as f:
+            for line in ["[Desktop Entry]", "Version=1.0",
+                         "Name=" + name, "Comment={0} (Ice SSB)".format(name),
+                         "Exec=chromium --app=http://example.test "
+                         "--class=ICE-SSB-" + formatted,
+                         "Terminal=false", "X-MultipleArgs=false",
+                         "Type=Application", "Icon=" + icon,
+                         "Categories=GTK;Network;",
+                         "MimeType=text/html;text/xml;application/xhtml_xml;",
+                         "StartupWMClass=ICE-SSB-" + formatted,
+                         "StartupNotify=true"]:
+                f.write(line + "\n")
+                f.flush()
+        subprocess.run(["update-desktop-database", "-q", ssb.APPS_DIR])
+
+
+def legacy_delete(names):
+    for name in names:
+        os.remove(ssb.appfile_path(ssb.formatted_name(name)))
+        subprocess.run(["update-desktop-database", "-q", ssb.APPS_DIR])
+
+
+def create(names, icon, pause):
+    with desktopdb.refresher(ssb.APPS_DIR).batch():
+        for name in names:
+            time.sleep(pause)
+            ssb.writefile(name, ssb.formatted_name(name),
+                          "http://example.test", icon, "png", "Network;",
+                          "chromium", True)
+
+
+def delete(names):
+    with desktopdb.refresher(ssb.APPS_DIR).batch():
+        for name in names:
+            ssb.delete(ssb.appfile_path(ssb.formatted_name(name)))
+
+
+def measure(step, log, menu):
+    before = refreshes(log)
+    counter = EventCounter(ssb.APPS_DIR)
+    counter.start()
+    start = time.perf_counter()
+    step()
+    seconds = time.perf_counter() - start
+    # wait out the debounce
+    time.sleep(menu.delay * 2)
+    events = counter.stop()
+    return {"seconds": seconds, "events": events,
+            "refreshes": refreshes(log) - before}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--max-runs", type=int, default=1)
+    parser.add_argument("--pause", type=float, default=0.25,
+                        help="seconds per app before it is created")
+    args = parser.parse_args()
+
+    try:
+        stubs = _HOME + "/stubs"
+        make_stubs(stubs)
+        os.environ["PATH"] = stubs + os.pathsep + os.environ["PATH"]
+        log = _HOME + "/refresh.log"
+        os.environ["ICE_BENCH_LOG"] = log
+        ssb.ensure_dirs()
+        icon = _HOME + "/icon.png"
+        with open(icon, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+
+        menu = desktopdb.refresher(ssb.APPS_DIR)
+        old = app_names("Legacy", args.count)
+        new = app_names("Bench", args.count)
+        results = [
+            ("old create", measure(lambda: legacy_create(old, icon), log,
+                                   menu)),
+            ("old remove", measure(lambda: legacy_delete(old), log, menu)),
+            ("create", measure(lambda: create(new, icon, args.pause), log,
+                               menu)),
+            ("remove", measure(lambda: delete(new), log, menu)),
+        ]
+    finally:
+        shutil.rmtree(_HOME, ignore_errors=True)
+
+    print("{0} SSBs per batch".format(args.count))
+    print("{0:<12} {1:>9} {2:>13} {3:>10}".format(
+        "batch", "seconds", "menu events", "refreshes"))
+    for name, result in results:
+        print("{0:<12} {1:>9.2f} {2:>13} {3:>10}".format(
+            name, result["seconds"], result["events"], result["refreshes"]))
+
+    worst = max(results[2][1]["refreshes"], results[3][1]["refreshes"])
+    if worst > args.max_runs:
+        print("FAIL: {0} refreshes for one batch (budget {1})".format(
+            worst, args.max_runs))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmark for desktopentry.parse against the line-by-line parser
+# Ice.get_details used before it, over synthetic .desktop files.
+#
+#   python3 bench/bench_desktopentry.py [--count 10000]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Resources"))
+
+import desktopentry  # noqa: E402
+
+_TEMPLATE = """[Desktop Entry]
+Version=1.0
+Name=Synthetic App {0}
+GenericName=Web Application
+Comment=Synthetic App {0} (Ice SSB)
+Exec=chromium-browser --app=https://example{0}.test --class=ICE-SSB-app{0} --user-data-dir=/tmp/profiles/app{0}
+X-ICE-SSB-Profile=app{0}
+Terminal=false
+X-MultipleArgs=false
+Type=Application
+Icon=/tmp/icons/app{0}.png
+Categories=GTK;Network;
+MimeType=text/html;text/xml;application/xhtml_xml;
+StartupWMClass=ICE-SSB-app{0}
+StartupNotify=true
+"""
+
+_OTHER = """[Desktop Entry]
+Name=Other Package {0}
+Exec=/usr/bin/other{0} %U
+Icon=other
+Type=Application
+
+[Desktop Action new-window]
+Name=New Window
+Exec=/usr/bin/other{0} --new-window
+"""
+
+
+def legacy_parse(app):
+    # Ice.get_details before desktopentry, minus the pixbuf decode
+    nameline = ""
+    iconline = ""
+    profile = ""
+    is_ice = False
+    with open(app, 'r', errors='ignore') as a:
+        for line in a:
+            if "Name=" in line:
+                array = line.replace("=", " ").split()
+                array.pop(0)
+                for word in array:
+                    nameline = nameline + word + " "
+            elif "Icon=" in line:
+                array = line.replace("=", " ").split()
+                array.pop(0)
+                for word in array:
+                    iconline = iconline + word
+            elif "StartupWMClass=ICE-SSB" in line:
+                is_ice = True
+            elif "IceFirefox=" in line:
+                profile = str.replace(line, 'IceFirefox=', '').strip()
+            elif "X-ICE-SSB-Profile=" in line:
+                profile = str.replace(line, 'X-ICE-SSB-Profile=', '').strip()
+    if nameline != "" and iconline != "" and is_ice is True:
+        return {'nameline': nameline, 'iconline': iconline,
+                'profile': profile}
+    return None
+
+
+def run(label, parse, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(1 for path in paths if parse(path) is not None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{0:<14} {1:>8.1f} ms  {2:>6.2f} us/file  {3} SSBs".format(
+        label, best * 1000, best * 1e6 / len(paths), found))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.count):
+            path = "{0}/app{1}.desktop".format(tmp, i)
+            with open(path, 'w') as f:
+                f.write((_TEMPLATE if i % 2 == 0 else _OTHER).format(i))
+            paths.append(path)
+
+        run("legacy", legacy_parse, paths, args.repeat)
+        run("desktopentry", desktopentry.parse, paths, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
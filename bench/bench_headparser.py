@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Icon discovery on a large single page app style document: the old
+# full-page BeautifulSoup lookup against favicon.parse_head, which stops
+# reading at </head>.
+#
+#   python3 bench/bench_headparser.py [--body-mb 4]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Resources"))
+
+import favicon  # noqa: E402
+
+_HEAD = """<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<title>Big App</title>
+<meta property="og:image" content="/static/og.png">
+<link rel="apple-touch-icon" sizes="180x180" href="/apple-touch-icon.png">
+<link rel="icon" type="image/png" sizes="32x32" href="/favicon-32x32.png">
+<link rel="shortcut icon" href="/favicon.ico">
+<script>window.__STATE__ = {"k": "%s"};</script>
+</head>
+"""
+
+_ROW = '<div class="row"><span class="cell">item %d</span><a href="/x/%d">link</a></div>\n'
+
+
+def document(body_mb):
+    head = (_HEAD % ("x" * 2048)).encode()
+    rows = []
+    size = 0
+    i = 0
+    while size < body_mb * 1024 * 1024:
+        row = _ROW % (i, i)
+        rows.append(row)
+        size += len(row)
+        i += 1
+    return head + ("<body>" + "".join(rows) + "</body></html>").encode()
+
+
+def chunks(data, size=16 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def bs4_lookup(data):
+    import bs4
+    soup = bs4.BeautifulSoup(data, "html.parser")
+    found = [soup.find("meta", {"property": "og:image"})]
+    for iconformat in favicon.ICON_RELS:
+        found.append(soup.find("link", {"rel": iconformat}))
+    return found
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--body-mb", type=float, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = document(args.body_mb)
+    print("document: {0:.1f} MB".format(len(data) / 1024 / 1024))
+
+    read = []
+
+    def streaming():
+        read.clear()
+        for chunk in chunks(data):
+            read.append(len(chunk))
+            yield chunk
+
+    head = favicon.parse_head(streaming())
+    print("parse_head    {0:>9.2f} ms  read {1} KB, {2} icon links".format(
+        timed(lambda: favicon.parse_head(streaming()), args.repeat) * 1000,
+        sum(read) // 1024, len(head.links) + (head.og_image is not None)))
+
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        print("bs4           not installed, skipped")
+        return
+    print("bs4 (full)    {0:>9.2f} ms  read {1} KB".format(
+        timed(lambda: bs4_lookup(data), args.repeat) * 1000,
+        len(data) // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#
+# Launch latency of generated SSBs, with stand-in browsers.
+#
+# Creates one SSB per backend in a throwaway HOME through the real
+# ssb.writefile (and the init_*_profile functions it calls), with a stub
+# executable on PATH in place of every browser. The stub records its
+# argv and CLOCK_MONOTONIC when it starts, so running an Exec= line
+# measures what the launcher adds before the browser would be up: the
+# stub's own start up (measured by running it directly) is subtracted.
+# ice-firefox.py is measured the same way, cold, warm and --ephemeral.
+#
+# For each case it reports the create time, the median launch overhead
+# and the file system changes (paths created, modified or removed, and
+# bytes written) under HOME and the working directory per launch.
+#
+#   python3 bench/bench_launch.py [--runs 20] [--output run.json]
+#   python3 bench/bench_launch.py --compare old.json
+#
+# Results are JSON keyed by case so runs from two commits can be
+# compared; --compare prints the change against an earlier file.
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_RESOURCES = os.path.abspath(os.path.join(os.path.dirname(__file__), "..",
+                                          "Resources"))
+
+# ssb, browsers and config read HOME when they are imported
+_HOME = tempfile.mkdtemp(prefix="ice-bench-home-")
+os.environ["HOME"] = _HOME
+sys.path.insert(0, _RESOURCES)
+
+import browsers  # noqa: E402
+import desktopentry  # noqa: E402
+import ssb  # noqa: E402
+
+_STUB = """#!{python} -S
+import json, os, sys, time
+t = time.monotonic()
+with open(os.environ["ICE_BENCH_LOG"], "a") as f:
+    f.write(json.dumps({{"t": t, "argv": sys.argv}}) + "\\n")
+"""
+
+# case name, browser key, isolate, ram
+_CASES = [
+    ("brave", "brave", False, False),
+    ("chrome", "chrome", False, False),
+    ("chromium", "chromium", False, False),
+    ("chromium-isolated", "chromium", True, False),
+    ("chromium-isolated-ram", "chromium", True, True),
+    ("vivaldi-isolated", "vivaldi", True, False),
+    ("firefox", "firefox", False, False),
+    ("firefox-ram", "firefox", False, True),
+    ("epiphany", "epiphany", False, False),
+]
+
+
+def make_stubs(directory):
+    os.makedirs(directory)
+    stub = _STUB.format(python=sys.executable)
+    for browser in browsers.TABLE:
+        path = "{0}/{1}".format(directory, browser.commands[0])
+        with open(path, "w") as f:
+            f.write(stub)
+        os.chmod(path, 0o755)
+
+
+def snapshot(roots):
+    found = {}
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+def changes(before, after):
+    created = [p for p in after if p not in before]
+    removed = [p for p in before if p not in after]
+    modified = [p for p in after if p in before and after[p] != before[p]]
+    written = sum(after[p][0] for p in created + modified)
+    return {"created": len(created), "modified": len(modified),
+            "removed": len(removed), "bytes": written}
+
+
+def run(args, log, cwd, roots):
+    # Returns (ms until the stub started, file system changes)
+    open(log, "w").close()
+    before = snapshot(roots)
+    start = time.monotonic()
+    subprocess.run(args, cwd=cwd, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=False)
+    after = snapshot(roots)
+    with open(log) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines:
+        raise SystemExit("no browser stub ran for: " + " ".join(args))
+    return (lines[0]["t"] - start) * 1000, changes(before, after)
+
+
+def measure(args, runs, log, cwd, roots, baseline, first=None):
+    times = []
+    fs = None
+    for i in range(runs):
+        ms, fs_changes = run(args, log, cwd, roots)
+        times.append(ms)
+        if i == 0 and first is not None:
+            first.update(fs_changes)
+        fs = fs_changes
+    median = statistics.median(times)
+    return {"launch_ms": median, "overhead_ms": median - baseline,
+            "min_ms": min(times), "max_ms": max(times), "fs": fs}
+
+
+def launch_args(appfile):
+    # The .desktop Exec= line as a desktop environment would run it
+    entry = desktopentry.parse(appfile)
+    return shlex.split(entry.exec_line)
+
+
+def bench(runs):
+    stubs = _HOME + "/stubs"
+    make_stubs(stubs)
+    os.environ["PATH"] = stubs + os.pathsep + os.environ["PATH"]
+    log = _HOME + "/launches.jsonl"
+    os.environ["ICE_BENCH_LOG"] = log
+    os.environ["XDG_RUNTIME_DIR"] = _HOME + "/run"
+    os.makedirs(_HOME + "/run")
+    # ramprofile.py writes everything back at exit
+    os.environ["ICE_RAMPROFILE_INTERVAL"] = "3600"
+    roots = [_HOME + "/.local", _HOME + "/run"]
+
+    icon = _HOME + "/icon.png"
+    with open(icon, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+
+    results = {}
+    direct = measure([stubs + "/firefox"], runs, log, _HOME, roots, 0)
+    baseline = direct["launch_ms"]
+    direct["overhead_ms"] = 0.0
+    results["stub"] = direct
+
+    # stand-ins for /usr/lib/peppermint/ice
+    ssb.FF_TEMPLATE_DIR = _HOME + "/seed"
+    os.makedirs(ssb.FF_TEMPLATE_DIR)
+    shutil.copy(_RESOURCES + "/search.json.mozlz4", ssb.FF_TEMPLATE_DIR)
+    with open(ssb.FF_TEMPLATE_DIR + "/places.sqlite", "wb") as f:
+        f.write(os.urandom(1024 * 1024))
+
+    for name, key, isolate, ram in _CASES:
+        start = time.perf_counter()
+        ssb.ensure_dirs()
+        formatted = ssb.formatted_name(name)
+        appfile = ssb.writefile(name, formatted, "http://example.test",
+                                icon, "png", "Network;", key, isolate, ram)
+        create_ms = (time.perf_counter() - start) * 1000
+        args = launch_args(appfile)
+        result = measure(args, runs, log, _HOME, roots, baseline)
+        result["create_ms"] = create_ms
+        results[name] = result
+
+    # ice-firefox.py keeps its profiles under ./profiles of its cwd
+    workdir = _HOME + "/ice-firefox"
+    os.makedirs(workdir)
+    shutil.copy(_RESOURCES + "/search.json.mozlz4", workdir)
+    launcher = [sys.executable, _RESOURCES + "/ice-firefox.py"]
+    roots_ff = roots + [workdir]
+    cold = {}
+    warm = measure(launcher + ["http://example.test/"], runs,
+                   log, workdir, roots_ff, baseline, first=cold)
+    warm["first_fs"] = cold
+    results["ice-firefox"] = warm
+    results["ice-firefox-ephemeral"] = measure(
+        launcher + ["--ephemeral", "http://example.test/"], runs, log,
+        workdir, roots_ff, baseline
+    )
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=_RESOURCES, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(results, previous=None):
+    print("{0:<24} {1:>9} {2:>11} {3:>9}  {4}".format(
+        "case", "create ms", "overhead ms", "launch ms",
+        "fs per launch (new/mod/del, bytes)"))
+    for name, result in results.items():
+        line = "{0:<24} {1:>9} {2:>11.2f} {3:>9.2f}  {4}/{5}/{6}, {7}".format(
+            name,
+            "{0:.2f}".format(result["create_ms"])
+            if "create_ms" in result else "-",
+            result["overhead_ms"], result["launch_ms"],
+            result["fs"]["created"], result["fs"]["modified"],
+            result["fs"]["removed"], result["fs"]["bytes"])
+        if previous and name in previous:
+            old = previous[name]["overhead_ms"]
+            line += "  ({0:+.2f} ms)".format(result["overhead_ms"] - old)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run")
+    args = parser.parse_args()
+
+    try:
+        results = bench(args.runs)
+    finally:
+        shutil.rmtree(_HOME, ignore_errors=True)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    report(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"commit": commit(), "python": sys.version.split()[0],
+                       "runs": args.runs, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# Creates Firefox SSB profiles the old way (copy the seed files, write
+# userChrome.css and user.js) and by cloning the profile template, and
+# reports time per profile and the disk blocks actually allocated.
+#
+#   python3 bench/bench_profiles.py [--count 1000] [--dir /path/on/btrfs]
+#
+# --dir picks the filesystem to test on; reflinks need btrfs or xfs,
+# elsewhere the template falls back to hardlinks and copies.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Resources"))
+
+import profiletemplate  # noqa: E402
+import ssb  # noqa: E402
+
+
+def seed(directory):
+    # Stand-ins for /usr/lib/peppermint/ice, sized like the real files
+    os.makedirs(directory)
+    with open(directory + "/search.json.mozlz4", "wb") as f:
+        f.write(os.urandom(40 * 1024))
+    with open(directory + "/places.sqlite", "wb") as f:
+        f.write(os.urandom(5 * 1024 * 1024))
+
+
+def legacy(source, path):
+    chromepath = path + "/chrome"
+    os.makedirs(chromepath)
+    shutil.copyfile(source + "/search.json.mozlz4",
+                    path + "/search.json.mozlz4")
+    shutil.copyfile(source + "/places.sqlite", path + "/places.sqlite")
+    with open(chromepath + "/userChrome.css", "w") as f:
+        f.write(ssb.FIREFOX_CSS)
+    with open(path + "/user.js", "w") as f:
+        f.write("".join(ssb.FIREFOX_PREFS))
+
+
+def allocated(root):
+    # Blocks of distinct inodes under root; hardlinks are counted once.
+    # (Reflinked extents are shared on disk but still show up here.)
+    seen = set()
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_blocks * 512
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        source = tmp + "/seed"
+        seed(source)
+
+        # Alternate the two so both see the same page cache and
+        # writeback conditions
+        legacy_time = 0.0
+        cloned_time = 0.0
+        counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+        for i in range(args.count):
+            start = time.perf_counter()
+            legacy(source, "{0}/legacy/p{1}".format(tmp, i))
+            legacy_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            template = profiletemplate.build(
+                tmp + "/templates", "firefox",
+                profiletemplate.firefox_files(source, ssb.FIREFOX_CSS,
+                                              ssb.FIREFOX_PREFS)
+            )
+            for kind, n in profiletemplate.clone(
+                    template, "{0}/cloned/p{1}".format(tmp, i)).items():
+                counts[kind] += n
+            cloned_time += time.perf_counter() - start
+
+        print("{0} profiles".format(args.count))
+        print("legacy    {0:>8.3f} ms/profile  {1:>8.1f} MB".format(
+            legacy_time * 1000 / args.count,
+            allocated(tmp + "/legacy") / 1024 / 1024))
+        print("template  {0:>8.3f} ms/profile  {1:>8.1f} MB  ({2})".format(
+            cloned_time * 1000 / args.count,
+            (allocated(tmp + "/cloned") +
+             allocated(tmp + "/templates")) / 1024 / 1024,
+            ", ".join("{0} {1}".format(n, kind)
+                      for kind, n in counts.items() if n)))
+
+
+if __name__ == '__main__':
+    main()
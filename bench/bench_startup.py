@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Start up benchmark for ice.py.
+#
+# Runs ice.py with -X importtime and ICE_STARTUP_PROBE=1 (the window
+# prints a timestamp when it is mapped and quits), and reports the
+# median time-to-window, the slowest imports, and whether any of the
+# lazily imported modules were loaded before the window appeared.
+#
+#   python3 bench/bench_startup.py [--runs 5] [--max-ms 1500]
+#   python3 bench/bench_startup.py --save baseline.json
+#   python3 bench/bench_startup.py --baseline baseline.json --tolerance 0.15
+#
+# Exits with status 1 when time-to-window is over --max-ms or more than
+# --tolerance slower than the baseline. Needs a display (or xvfb-run).
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "Resources")
+
+# Must not be imported before the window is shown
+_DEFERRED = ["requests", "favicon", "webclient", "bs4", "urllib.request"]
+
+
+def run_once():
+    env = dict(os.environ, ICE_STARTUP_PROBE="1")
+    start = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(_RESOURCES,
+                                                          "ice.py")],
+        env=env, capture_output=True, text=True, timeout=60
+    )
+    mapped = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("ICE_STARTUP_MAPPED "):
+            mapped = float(line.split()[1])
+    if mapped is None:
+        sys.stderr.write(proc.stderr[-2000:])
+        raise SystemExit("ice.py did not report a mapped window "
+                         "(is there a display?)")
+
+    imports = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[1].strip().isdigit():
+            continue
+        imports[fields[2].strip()] = int(fields[1])
+    return (mapped - start) * 1000, imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=1500)
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save")
+    args = parser.parse_args()
+
+    times = []
+    imports = {}
+    for _ in range(args.runs):
+        elapsed, imports = run_once()
+        times.append(elapsed)
+    median = statistics.median(times)
+
+    print("time-to-window: median {0:.0f} ms (min {1:.0f}, max {2:.0f}) "
+          "over {3} runs".format(median, min(times), max(times), args.runs))
+    print("slowest imports (cumulative):")
+    top = sorted(imports.items(), key=lambda kv: kv[1], reverse=True)
+    for name, us in [kv for kv in top if "." not in kv[0]][:10]:
+        print("  {0:>8.1f} ms  {1}".format(us / 1000, name))
+
+    failed = False
+    early = [name for name in _DEFERRED if name in imports]
+    if early:
+        print("FAIL: imported before the window appeared: " +
+              ", ".join(early))
+        failed = True
+
+    if median > args.max_ms:
+        print("FAIL: {0:.0f} ms is over the {1:.0f} ms budget".format(
+            median, args.max_ms))
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["median_ms"]
+        if median > baseline * (1 + args.tolerance):
+            print("FAIL: {0:.0f} ms regressed from {1:.0f} ms "
+                  "(tolerance {2:.0%})".format(median, baseline,
+                                               args.tolerance))
+            failed = True
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"median_ms": median, "runs": times}, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())